@@ -3,104 +3,170 @@ import numpy as np
 import heapq
 from math import sqrt
 from collections import Counter
-from scipy import stats
+from scipy import stats, sparse
 import matplotlib.pyplot as plt
 import statistics
 
 
 
 # In[2]:
-def readFile(filename):
+def readFile(filename, binary=True):
+    # binary=False keeps each row's class name instead of mapping it to 0/1 (multinomial models)
     data = []
     labels = []
     with open(filename, "r") as file:
         for line in file:
             line = line.strip()
             if line:  # Skip empty lines
-                row = line.split(",")
-                if filename == "adult.data":
-                    # Convert non-numerical features to float
-                    age = float(row[0])
-                    fnlwgt = float(row[2])
-                    education_num = float(row[4])
-                    capital_gain = float(row[10])
-                    capital_loss = float(row[11])
-                    hours_per_week = float(row[12])
-                    # Combine the numerical features
-                    numerical_features = [age, fnlwgt, education_num, capital_gain, capital_loss, hours_per_week]
-                    # Append the numerical features
-                    data.append(numerical_features)
-                    label = row[-1]
-                    # Map the labels to binary values, e.g., '<=50K' to 0 and '>50K' to 1
-                    labels.append(0 if label == ' <=50K' else 1)
-                elif filename == "Rice_Cammeo_Osmancik.arff.txt":
-                    data.append([float(val) for val in row[:-1]])
-                    label = row[-1]
-                    labels.append(0 if label == 'Cammeo' else 1)
-                elif "agaricus-lepiota.data" in filename :
-                    label = 0 if row[0] == 'e' else 1
-                    labels.append(label)
-
-                    # Define mappings for categorical values
-                    cap_shape_mapping = {'b': 0, 'c': 1, 'x': 2, 'f': 3, 'k': 4, 's': 5}
-                    cap_surface_mapping = {'f': 0, 'g': 1, 'y': 2, 's': 3}
-                    cap_color_mapping = {'n': 0, 'b': 1, 'c': 2, 'g': 3, 'r': 4, 'p': 5, 'u': 6, 'e': 7, 'w': 8, 'y': 9}
-                    bruises_mapping = {'t': 0, 'f': 1}
-                    odor_mapping = {'a': 0, 'l': 1, 'c': 2, 'y': 3, 'f': 4, 'm': 5, 'n': 6, 'p': 7, 's': 8}
-                    gill_attachment_mapping = {'a': 0, 'd': 1, 'f': 2, 'n': 3}
-                    gill_spacing_mapping = {'c': 0, 'w': 1, 'd': 2}
-                    gill_size_mapping = {'b': 0, 'n': 1}
-                    gill_color_mapping = {'k': 0, 'n': 1, 'b': 2, 'h': 3, 'g': 4, 'r': 5, 'o': 6, 'p': 7, 'u': 8, 'e': 9, 'w': 10, 'y': 11}
-                    stalk_shape_mapping = {'e': 0, 't': 1}
-                    stalk_root_mapping = {'b': 0, 'c': 1, 'u': 2, 'e': 3, 'z': 4, 'r': 5, '?': 6}
-                    stalk_surface_above_ring_mapping = {'f': 0, 'y': 1, 'k': 2, 's': 3}
-                    stalk_surface_below_ring_mapping = {'f': 0, 'y': 1, 'k': 2, 's': 3}
-                    stalk_color_above_ring_mapping = {'n': 0, 'b': 1, 'c': 2, 'g': 3, 'o': 4, 'p': 5, 'e': 6, 'w': 7, 'y': 8}
-                    stalk_color_below_ring_mapping = {'n': 0, 'b': 1, 'c': 2, 'g': 3, 'o': 4, 'p': 5, 'e': 6, 'w': 7, 'y': 8}
-                    veil_type_mapping = {'p': 0, 'u': 1}
-                    veil_color_mapping = {'n': 0, 'o': 1, 'w': 2, 'y': 3}
-                    ring_number_mapping = {'n': 0, 'o': 1, 't': 2}
-                    ring_type_mapping = {'c': 0, 'e': 1, 'f': 2, 'l': 3, 'n': 4, 'p': 5, 's': 6, 'z': 7}
-                    spore_print_color_mapping = {'k': 0, 'n': 1, 'b': 2, 'h': 3, 'r': 4, 'o': 5, 'u': 6, 'w': 7, 'y': 8}
-                    population_mapping = {'a': 0, 'c': 1, 'n': 2, 's': 3, 'v': 4, 'y': 5}
-                    habitat_mapping = {'g': 0, 'l': 1, 'm': 2, 'p': 3, 'u': 4, 'w': 5, 'd': 6}
-
-                    # Convert non-numerical features to float using the mappings
-                    encoded_features = [
-                        cap_shape_mapping[row[1]],
-                        cap_surface_mapping[row[2]],
-                        cap_color_mapping[row[3]],
-                        bruises_mapping[row[4]],
-                        odor_mapping[row[5]],
-                        gill_attachment_mapping[row[6]],
-                        gill_spacing_mapping[row[7]],
-                        gill_size_mapping[row[8]],
-                        gill_color_mapping[row[9]],
-                        stalk_shape_mapping[row[10]],
-                        stalk_root_mapping[row[11]],
-                        stalk_surface_above_ring_mapping[row[12]],
-                        stalk_surface_below_ring_mapping[row[13]],
-                        stalk_color_above_ring_mapping[row[14]],
-                        stalk_color_below_ring_mapping[row[15]],
-                        veil_type_mapping[row[16]],
-                        veil_color_mapping[row[17]],
-                        ring_number_mapping[row[18]],
-                        ring_type_mapping[row[19]],
-                        spore_print_color_mapping[row[20]],
-                        population_mapping[row[21]],
-                        habitat_mapping[row[22]]
-                    ]
-                    data.append(encoded_features) 
-                        
-                else:
-                    data.append([float(val) for val in row[:-1]])
-                    label = row[-1]
-                    labels.append(0 if label == 'b' else 1)
+                features, label = parseRow(filename, line.split(","), binary)
+                data.append(features)
+                labels.append(label)
 
 
     return data, labels
 
 
+def readFileChunks(filename, chunk_size=10000, binary=True):
+    # Same rows as readFile, but yields (data, labels) NumPy blocks of at most chunk_size
+    # rows while reading, so a file larger than memory can be streamed into
+    # LogisticRegression.fit_stream (pass lambda: readFileChunks(name) for several epochs)
+    data = []
+    labels = []
+    with open(filename, "r") as file:
+        for line in file:
+            line = line.strip()
+            if line:  # Skip empty lines
+                features, label = parseRow(filename, line.split(","), binary)
+                data.append(features)
+                labels.append(label)
+                if len(data) == chunk_size:
+                    yield np.asarray(data, dtype=float), np.asarray(labels, dtype=int if binary else None)
+                    data = []
+                    labels = []
+    if data:
+        yield np.asarray(data, dtype=float), np.asarray(labels, dtype=int if binary else None)
+
+
+# Define mappings for categorical values, in column order after the label
+MUSHROOM_MAPPINGS = [
+    {'b': 0, 'c': 1, 'x': 2, 'f': 3, 'k': 4, 's': 5},  # cap_shape
+    {'f': 0, 'g': 1, 'y': 2, 's': 3},  # cap_surface
+    {'n': 0, 'b': 1, 'c': 2, 'g': 3, 'r': 4, 'p': 5, 'u': 6, 'e': 7, 'w': 8, 'y': 9},  # cap_color
+    {'t': 0, 'f': 1},  # bruises
+    {'a': 0, 'l': 1, 'c': 2, 'y': 3, 'f': 4, 'm': 5, 'n': 6, 'p': 7, 's': 8},  # odor
+    {'a': 0, 'd': 1, 'f': 2, 'n': 3},  # gill_attachment
+    {'c': 0, 'w': 1, 'd': 2},  # gill_spacing
+    {'b': 0, 'n': 1},  # gill_size
+    {'k': 0, 'n': 1, 'b': 2, 'h': 3, 'g': 4, 'r': 5, 'o': 6, 'p': 7, 'u': 8, 'e': 9, 'w': 10, 'y': 11},  # gill_color
+    {'e': 0, 't': 1},  # stalk_shape
+    {'b': 0, 'c': 1, 'u': 2, 'e': 3, 'z': 4, 'r': 5, '?': 6},  # stalk_root
+    {'f': 0, 'y': 1, 'k': 2, 's': 3},  # stalk_surface_above_ring
+    {'f': 0, 'y': 1, 'k': 2, 's': 3},  # stalk_surface_below_ring
+    {'n': 0, 'b': 1, 'c': 2, 'g': 3, 'o': 4, 'p': 5, 'e': 6, 'w': 7, 'y': 8},  # stalk_color_above_ring
+    {'n': 0, 'b': 1, 'c': 2, 'g': 3, 'o': 4, 'p': 5, 'e': 6, 'w': 7, 'y': 8},  # stalk_color_below_ring
+    {'p': 0, 'u': 1},  # veil_type
+    {'n': 0, 'o': 1, 'w': 2, 'y': 3},  # veil_color
+    {'n': 0, 'o': 1, 't': 2},  # ring_number
+    {'c': 0, 'e': 1, 'f': 2, 'l': 3, 'n': 4, 'p': 5, 's': 6, 'z': 7},  # ring_type
+    {'k': 0, 'n': 1, 'b': 2, 'h': 3, 'r': 4, 'o': 5, 'u': 6, 'w': 7, 'y': 8},  # spore_print_color
+    {'a': 0, 'c': 1, 'n': 2, 's': 3, 'v': 4, 'y': 5},  # population
+    {'g': 0, 'l': 1, 'm': 2, 'p': 3, 'u': 4, 'w': 5, 'd': 6},  # habitat
+]
+
+
+def parseRow(filename, row, binary=True):
+    # Turn one split line of a supported file into (numeric features, 0/1 label), or with
+    # binary=False (numeric features, class name as written in the file)
+    if filename == "adult.data":
+        # Convert non-numerical features to float
+        age = float(row[0])
+        fnlwgt = float(row[2])
+        education_num = float(row[4])
+        capital_gain = float(row[10])
+        capital_loss = float(row[11])
+        hours_per_week = float(row[12])
+        # Combine the numerical features
+        numerical_features = [age, fnlwgt, education_num, capital_gain, capital_loss, hours_per_week]
+        label = row[-1]
+        # Map the labels to binary values, e.g., '<=50K' to 0 and '>50K' to 1
+        return numerical_features, (0 if label == ' <=50K' else 1) if binary else label.strip()
+    elif filename == "Rice_Cammeo_Osmancik.arff.txt":
+        label = row[-1]
+        return [float(val) for val in row[:-1]], (0 if label == 'Cammeo' else 1) if binary else label.strip()
+    elif "agaricus-lepiota.data" in filename :
+        label = row[0]
+        # Convert non-numerical features to float using the mappings
+        encoded_features = [mapping[value] for mapping, value in zip(MUSHROOM_MAPPINGS, row[1:])]
+        return encoded_features, (0 if label == 'e' else 1) if binary else label
+    else:
+        label = row[-1]
+        return [float(val) for val in row[:-1]], (0 if label == 'b' else 1) if binary else label.strip()
+
+
+
+def oneHotEncode(rows, vocabulary=None):
+    # One-hot encode rows of raw string features into a scipy.sparse CSR matrix without ever
+    # building the dense rows x vocabulary array: a column whose values all parse as numbers
+    # stays one numeric column, every other column gets one 0/1 column per value it takes.
+    # vocabulary is learnt from rows when None (one entry per input column, None for numeric
+    # columns, else {value: output column}); pass the returned one to encode test rows the
+    # same way, values it has not seen encode as all zeros
+    rows = np.asarray(rows, dtype=str)
+    num_rows, num_columns = rows.shape
+    if vocabulary is None:
+        vocabulary = []
+        width = 0
+        for column in rows.T:
+            try:
+                column.astype(float)
+                vocabulary.append(None)
+                width += 1
+            except ValueError:
+                values = np.unique(column)
+                vocabulary.append({str(value): width + i for i, value in enumerate(values)})
+                width += len(values)
+    elif len(vocabulary) != num_columns:
+        raise ValueError(f"vocabulary has {len(vocabulary)} columns, rows have {num_columns}")
+    width = sum(1 if mapping is None else len(mapping) for mapping in vocabulary)
+
+    # one stored value per (row, input column), so nnz grows with rows x input columns only
+    values = np.ones((num_rows, num_columns))
+    indices = np.empty((num_rows, num_columns), dtype=np.int64)
+    start = 0
+    for col, mapping in enumerate(vocabulary):
+        if mapping is None:
+            values[:, col] = rows[:, col].astype(float)
+            indices[:, col] = start
+            start += 1
+        else:
+            indices[:, col] = [mapping.get(value, -1) for value in rows[:, col]]
+            values[indices[:, col] < 0, col] = 0 # unseen value
+            start += len(mapping)
+    np.maximum(indices, 0, out=indices)
+    matrix = sparse.csr_matrix((values.ravel(), indices.ravel(), np.arange(0, num_rows * num_columns + 1, num_columns)),
+                               shape=(num_rows, width))
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+    return matrix, vocabulary
+
+
+def readFileOneHot(filename, binary=True, vocabulary=None):
+    # Every feature column of the file (adult's categorical columns too, which readFile drops)
+    # through oneHotEncode, returns (CSR matrix, labels, vocabulary) for LogisticRegression
+    rows = []
+    labels = []
+    label_column = 0 if "agaricus-lepiota.data" in filename else -1
+    with open(filename, "r") as file:
+        for line in file:
+            line = line.strip()
+            if line:  # Skip empty lines
+                row = [value.strip() for value in line.split(",")]
+                labels.append(parseRow(filename, line.split(","), binary)[1])
+                del row[label_column]
+                rows.append(row)
+    data, vocabulary = oneHotEncode(rows, vocabulary)
+    return data, labels, vocabulary
+
 
 def readFileLog(filename):
     data = []
@@ -248,28 +314,62 @@ def readFileKNN(filename):
     return data
 
 
-def bestKValue(KNNmodel, dataSet, kRange=10):
-    accuracy = []
-    k_val =[]
-    for k in range(kRange):
-        print("Testing k = %d" % (k+1))
-        k_val.append(k+1)
-        KNNmodel.setK(k+1)
-        accuracy.append(KNNmodel.kFoldCross(dataSet,5, False))
-        
-    plt.figure(figsize=(8, 6))
-    plt.plot(k_val, accuracy, marker='o', linestyle='-')
-    plt.title('KNN Model Accuracy vs. k')
-    plt.xlabel('k (Number of Neighbors)')
-    plt.ylabel('Accuracy')
-    plt.grid(True)
-    plt.show()
+def encodeFeatures(mat):
+    """
+    Replace every non-numeric column in `mat` (all rows, except
+    the last column = label) with 0,1,2,… ordinal tokens.
+    Labels stay untouched.
+    Returns an object-dtype array suitable for kNN.kFoldCross().
+    Used on readFileKNN output by Models.main and Server.py bench.
+    """
+    mat = np.asarray(mat).astype(object)       # keep heterogeneity
+    n_cols = mat.shape[1] - 1                  # skip label col
+
+    for col in range(n_cols):
+        try:
+            mat[:, col].astype(float)          # already numeric?
+        except ValueError:
+            uniq, inv = np.unique(mat[:, col], return_inverse=True)
+            mat[:, col] = inv                  # 0…N encoding
+    return mat
+
+
+def bestKValue(KNNmodel, dataSet, kRange=10, plot=True, sweep=True, return_table=False, loo=False):
+    if loo:
+        # leave one out: one self-join of the whole set scores every k
+        print("Testing k = 1 to %d (leave one out)" % kRange)
+        k_val = list(range(1, kRange + 1))
+        accuracy = KNNmodel.leaveOneOut(dataSet, False, kRange)
+    elif sweep:
+        # one neighbour search per fold scores every k at once
+        print("Testing k = 1 to %d" % kRange)
+        k_val = list(range(1, kRange + 1))
+        accuracy = KNNmodel.kSweep(dataSet, 5, kRange)
+    else:
+        accuracy = []
+        k_val =[]
+        for k in range(kRange):
+            print("Testing k = %d" % (k+1))
+            k_val.append(k+1)
+            KNNmodel.setK(k+1)
+            accuracy.append(KNNmodel.kFoldCross(dataSet,5, False))
+
+    if plot:
+        plt.figure(figsize=(8, 6))
+        plt.plot(k_val, accuracy, marker='o', linestyle='-')
+        plt.title('KNN Model Accuracy vs. k')
+        plt.xlabel('k (Number of Neighbors)')
+        plt.ylabel('Accuracy')
+        plt.grid(True)
+        plt.show()
 
     # return the best k value based on the highest accuracy
     best_k_index = np.argmax(accuracy)
     best_k = k_val[best_k_index]
     best_accuracy = accuracy[best_k_index]
     print(f"Best k value: {best_k} with accuracy: {best_accuracy:.2f}")
+    if return_table:
+        return best_k, dict(zip(k_val, accuracy))
     return best_k
 
 # In[ ]:
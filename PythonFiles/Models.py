@@ -1,106 +1,868 @@
 import numpy as np
 import heapq
+import copy
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, Pipe, Process
 from math import sqrt
-from collections import Counter
-from scipy import stats
+from collections import Counter, OrderedDict, namedtuple
+from scipy import stats, sparse
 import matplotlib.pyplot as plt
-import statistics
 
 
 # In[3]:
 
 
+_SOLVERS = ("gd", "sgd", "newton", "lbfgs")
+_SCHEDULES = ("constant", "inverse", "exponential")
+_MULTI_CLASS = ("binary", "multinomial")
+_GRAD_TOL = 1e-6 #newton/lbfgs stop once the gradient norm is this small
+_STALL_TOL = 1e-10 #... or once an iteration lowers the cost by less than this (e.g. separable data)
+_LBFGS_MEMORY = 10 #curvature pairs kept by the lbfgs solver
+_LR_SETTINGS = ("solver", "batch_size", "epochs", "shuffle", "schedule", "decay", "random_state", "dtype",
+                "cost_every", "l2", "warm_start", "n_jobs", "multi_class") #LogisticRegression constructor arguments kept by save
+
+
+def _as_matrix(data, dtype=float):
+    # training/scoring input as a NumPy array, or a scipy.sparse CSR matrix kept sparse (one-hot data)
+    if sparse.issparse(data):
+        return sparse.csr_matrix(data, dtype=dtype)
+    return np.asarray(data, dtype=dtype)
+
+
+def _check_multinomial(multi_class, solver, n_jobs):
+    # the softmax loop is single process full batch gradient descent, refuse settings it would ignore
+    if multi_class != "multinomial":
+        return
+    if solver != "gd":
+        raise ValueError(f"multi_class='multinomial' trains with solver='gd', got {solver!r}")
+    if (n_jobs or 1) != 1:
+        raise ValueError(f"multi_class='multinomial' trains in one process, got n_jobs={n_jobs!r} (LogisticRegression.k_fold(n_jobs=...) still runs folds in parallel)")
+
+
+def _log_loss(z, labels):
+    # mean cross entropy from the linear model z, log(1 + e^z) - y*z without overflow
+    return np.mean(np.logaddexp(0, z) - labels * z)
+
+
+_SCALERS = ("standard", "minmax", "robust")
+_SCALER_SAMPLE = 100000 #rows kept by the reservoir of a robust Scaler, its quantiles are exact below this
+
+
+class Scaler:
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    per column feature scaling shared by LogisticRegression and kNN (pass it, or just 
+    the method name, as their scaler argument). The statistics are gathered in one 
+    streaming pass: partial_fit can be fed chunk after chunk (e.g. Functions.
+    readFileChunks) and keeps running sums (standard), running extremes (minmax) or a 
+    reservoir sample of rows (robust) in float64. transform writes x' = (x - center) *
+    (1 / scale) into one float32/float64 buffer in place, without temporaries. scipy 
+    sparse input is only scaled, never centered, so it stays sparse
+    ===================================================================================
+    PARAMETERS:
+    ===================================================================================
+    * method (string):
+    ----------------------------------------
+    "standard" (mean, standard deviation), "minmax" (minimum, range, to [0, 1]) or 
+    "robust" (median, interquartile range, for columns with outliers)
+    ----------------------------------------
+    * dtype (string):
+    ----------------------------------------
+    "float64" or "float32", type of the transformed rows
+    ----------------------------------------
+    * sample_size (int), random_state (int):
+    ----------------------------------------
+    robust only: rows kept in the reservoir the quantiles come from, and its seed
+    ===================================================================================
+    '''
+    def __init__(self, method="standard", dtype="float64", sample_size=_SCALER_SAMPLE, random_state=None):
+        if method not in _SCALERS:
+            raise ValueError(f"method must be one of {_SCALERS}, got {method!r}")
+        if np.dtype(dtype) not in (np.dtype(np.float64), np.dtype(np.float32)):
+            raise ValueError(f"dtype must be 'float64' or 'float32', got {dtype!r}")
+        self.method = method
+        self.dtype = np.dtype(dtype)
+        self.sample_size = sample_size
+        self.random_state = random_state
+        self.reset()
+
+    def reset(self):
+        # forget every statistic, the next partial_fit starts a new pass
+        self.n_seen = 0
+        self.mean = self.m2 = None #standard: running mean and sum of squared deviations
+        self.data_min = self.data_max = None #minmax
+        self.sample = None #robust: reservoir of at most sample_size rows
+        self.rng = np.random.default_rng(self.random_state)
+        self.center = None #transform: x' = (x - center) / scale
+        self.scale = None
+
+    def fit(self, data):
+        self.reset()
+        return self.partial_fit(data)
+
+    def partial_fit(self, data):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        add one chunk of rows to the statistics and update center and scale. Chunks are 
+        merged exactly (Chan's update of mean and squared deviations for standard), so 
+        any split of the data gives the statistics of the whole
+        ===================================================================================
+        '''
+        data = _as_matrix(data)
+        rows = data.shape[0]
+        if rows == 0:
+            return self
+        total = self.n_seen + rows
+        if self.method == "standard":
+            if sparse.issparse(data):
+                mean = np.asarray(data.mean(axis=0)).ravel()
+                m2 = np.asarray(data.multiply(data).sum(axis=0)).ravel() - rows * mean**2
+            else:
+                mean = data.mean(axis=0)
+                m2 = ((data - mean)**2).sum(axis=0)
+            if self.mean is None:
+                self.mean, self.m2 = mean, m2
+            else:
+                delta = mean - self.mean
+                self.mean = self.mean + delta * rows / total
+                self.m2 = self.m2 + m2 + delta**2 * self.n_seen * rows / total
+        elif self.method == "minmax":
+            low = data.min(axis=0)
+            high = data.max(axis=0)
+            if sparse.issparse(data):
+                low, high = low.toarray().ravel(), high.toarray().ravel()
+            self.data_min = low if self.data_min is None else np.minimum(self.data_min, low)
+            self.data_max = high if self.data_max is None else np.maximum(self.data_max, high)
+        else:
+            self.__sampleRows(data)
+        self.n_seen = total
+        self.__finish()
+        return self
+
+    def __sampleRows(self, data):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function used in self.partial_fit() for robust scaling. Reservoir 
+        sampling (algorithm R) of the rows seen so far: row t replaces a random slot with 
+        probability sample_size / (t + 1), so the sample stays uniform over the stream
+        ===================================================================================
+        '''
+        positions = self.n_seen + np.arange(data.shape[0])
+        slots = np.where(positions < self.sample_size, positions, self.rng.integers(0, positions + 1))
+        keep = np.flatnonzero(slots < self.sample_size)
+        if self.sample is None:
+            self.sample = np.empty((min(self.sample_size, self.n_seen + data.shape[0]), data.shape[1]))
+        elif len(self.sample) < self.sample_size:#still filling
+            grown = np.empty((min(self.sample_size, self.n_seen + data.shape[0]), data.shape[1]))
+            grown[:len(self.sample)] = self.sample
+            self.sample = grown
+        #a slot drawn twice in one chunk holds the later row, as in the row by row algorithm
+        last = len(keep) - 1 - np.unique(slots[keep][::-1], return_index=True)[1]
+        chosen = data[keep[last]]
+        self.sample[slots[keep[last]]] = chosen.toarray() if sparse.issparse(chosen) else chosen
+
+    def __finish(self):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function used in self.partial_fit(): center and scale from the running 
+        statistics. A constant column gets scale 1 so it maps to 0 instead of dividing by 0
+        ===================================================================================
+        '''
+        if self.method == "standard":
+            self.center = self.mean
+            scale = np.sqrt(np.maximum(self.m2, 0) / self.n_seen)
+        elif self.method == "minmax":
+            self.center = self.data_min
+            scale = self.data_max - self.data_min
+        else:
+            low, self.center, high = np.percentile(self.sample, [25, 50, 75], axis=0)
+            scale = high - low
+        scale[scale == 0] = 1
+        self.scale = scale
+
+    def transform(self, data, copy=True):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        scale rows with the fitted statistics. The rows are converted to self.dtype once
+        (or, with copy=False, a float array of that dtype is scaled where it is) and 
+        centered and scaled in place. Sparse rows only have their stored values scaled
+        ===================================================================================
+        RETURNS:
+        ===================================================================================
+        * data (NumPy Array or scipy.sparse CSR matrix):
+        ----------------------------------------
+        scaled rows of dtype self.dtype
+        ===================================================================================
+        '''
+        if self.scale is None:
+            raise ValueError("fit the scaler before transforming")
+        if sparse.issparse(data):
+            data = sparse.csr_matrix(data, dtype=self.dtype, copy=copy)
+            data.data *= (1 / self.scale)[data.indices]
+            return data
+        data = np.array(data, dtype=self.dtype) if copy else np.asarray(data, dtype=self.dtype)
+        if data.ndim != 2 or data.shape[1] != len(self.scale):
+            raise ValueError(f"scaler was fitted on {len(self.scale)} columns, got shape {data.shape}")
+        data -= self.center
+        data *= 1 / self.scale
+        return data
+
+    def fit_transform(self, data):
+        return self.fit(data).transform(data)
+
+    def _state(self):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        arrays and scalar settings that rebuild this scaler through _restore (model save)
+        ===================================================================================
+        '''
+        arrays = {name: getattr(self, name) for name in ("center", "scale", "mean", "m2", "data_min", "data_max", "sample")
+                  if getattr(self, name) is not None}
+        settings = {"method": self.method, "dtype": self.dtype.name, "sample_size": self.sample_size,
+                    "random_state": self.random_state, "n_seen": self.n_seen}
+        return arrays, settings
+
+    @classmethod
+    def _restore(cls, arrays, settings):
+        scaler = cls(settings["method"], settings["dtype"], settings["sample_size"], settings["random_state"])
+        scaler.n_seen = settings["n_seen"]
+        scaler.__dict__.update(arrays)
+        return scaler
+
+
+def _as_scaler(scaler, dtype):
+    # a model's scaler argument: None, a Scaler, or a method name for a new Scaler of dtype
+    if scaler is None or isinstance(scaler, Scaler):
+        return scaler
+    return Scaler(scaler, dtype)
+
+
+def _save_scaler(scaler, path):
+    # scaler_*.npy files next to a saved model, returns what its meta.json keeps
+    if scaler is None:
+        return None
+    arrays, settings = scaler._state()
+    for name, array in arrays.items():
+        np.save(os.path.join(path, "scaler_" + name + ".npy"), array, allow_pickle=False)
+    return {"settings": settings, "arrays": sorted(arrays)}
+
+
+def _load_scaler(path, saved):
+    if saved is None:
+        return None
+    arrays = {name: np.load(os.path.join(path, "scaler_" + name + ".npy")) for name in saved["arrays"]}
+    return Scaler._restore(arrays, saved["settings"])
+
+
 class LogisticRegression:
-    def __init__(self):
+    def __init__(self, solver="gd", batch_size=32, epochs=10, shuffle=True, schedule="constant", decay=0.1, random_state=None, dtype="float64", cost_every=1, l2=0.0, warm_start=False, n_jobs=1, multi_class="binary", scaler=None):
+        if solver not in _SOLVERS:
+            raise ValueError(f"solver must be one of {_SOLVERS}, got {solver!r}")
+        if multi_class not in _MULTI_CLASS:
+            raise ValueError(f"multi_class must be one of {_MULTI_CLASS}, got {multi_class!r}")
+        _check_multinomial(multi_class, solver, n_jobs)
+        if schedule not in _SCHEDULES:
+            raise ValueError(f"schedule must be one of {_SCHEDULES}, got {schedule!r}")
         self.learning_rate = 0.01
         self.num_iterations = 1000
         self.weights = None
         self.bias = None
         self.iter = 0
+        self.grad_norm = None #norm of the gradient at the end of fit (gd, newton, lbfgs)
+        self.solver = solver #"gd": full batch gradient descent, "sgd": shuffled mini-batches (see fit_stream),
+                             #"newton": Newton/IRLS for few features, "lbfgs": limited memory quasi-Newton
+        self.batch_size = batch_size #sgd only, rows per update
+        self.epochs = epochs #sgd only, most passes over the data
+        self.shuffle = shuffle #sgd only, visit the rows of every chunk in a new random order each epoch
+        self.schedule = schedule #sgd only, learning rate per epoch: constant, rate/(1+decay*epoch), rate*exp(-decay*epoch)
+        self.decay = decay
+        self.random_state = random_state
+        self.dtype = np.dtype(dtype) #gd only, float32 halves the memory traffic of every iteration
+        self.cost_every = cost_every #gd only, evaluate the cost (and the convergence test) every N iterations
+        self.l2 = l2 #strength of the penalty l2/2 * |weights|^2 added to the mean log loss (bias not penalized)
+        self.warm_start = warm_start #fit starts from the current weights instead of zeros (see k_fold_path)
+        self.n_jobs = n_jobs #gd only, worker processes sharing every gradient (see fit_sharded), -1 for one per CPU
+        self.multi_class = multi_class #"binary": 0/1 labels, "multinomial": softmax over any labels (weights is features x classes), solver="gd" and n_jobs=1 only
+        self.classes = None #multinomial only, sorted labels, column c of weights scores classes[c]
+        self.scaler = _as_scaler(scaler, self.dtype) #Scaler (or its method name) refitted by fit and applied before predict, weights are in scaled units
+        self.source = None #how the training rows were read (dataset, reader), kept by save so Server.py bench reads rows the same way
 
     def set_learning_rate(self, val):
         self.learning_rate = val
 
     def sigmoid(self, z):
         # Sigmoid function to convert values to probabilities between 0 and 1
-        return 1 / (1 + np.exp(-z)) #sigmoid(z) = 1 / ( 1 + e( - z ) )
+        exp_neg = np.exp(-np.abs(z)) #e^-|z| never overflows, same form as the gd loop of fit
+        return np.where(z >= 0, 1 / (1 + exp_neg), exp_neg / (1 + exp_neg)) #sigmoid(z) = 1 / ( 1 + e( - z ) )
 
     def fit(self, data, labels): #training the logistic regression model
+        _check_multinomial(self.multi_class, self.solver, self.n_jobs) #settings may have changed since __init__
+        if self.solver == "sgd":
+            return self.fit_stream([(data, labels)])
+        if self.scaler is not None:
+            data = self.scaler.fit_transform(data) #one scaled copy, every solver below trains on it
+        if self.multi_class == "multinomial":
+            return self.fit_multinomial(data, labels)
+        if self.solver == "newton":
+            return self.fit_newton(data, labels)
+        if self.solver == "lbfgs":
+            return self.fit_lbfgs(data, labels)
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else (self.n_jobs or 1)
+        if n_jobs > 1:
+            return self.fit_sharded(data, labels, n_jobs)
+        data = _as_matrix(data, self.dtype)
+        labels = np.asarray(labels, dtype=self.dtype)
         num_samples, num_features = data.shape
-        self.weights = np.zeros(num_features)
-        self.bias = 0
+        self.weights, self.bias = self.start_point(num_features)
+        self.weights = self.weights.astype(self.dtype)
         converge=0.0001
         converged = False
         cost1 = 1
         count = 0
         self.iter = 0
+
+        # Buffers reused by every iteration, so the loop itself allocates nothing of size m
+        linear_model = np.empty(num_samples, dtype=self.dtype)
+        exp_neg = np.empty(num_samples, dtype=self.dtype) #e^-|z|, shared by the sigmoid and the cost
+        predictions = np.empty(num_samples, dtype=self.dtype)
+        error = np.empty(num_samples, dtype=self.dtype)
+        negative = np.empty(num_samples, dtype=bool)
+        dw = np.empty(num_features, dtype=self.dtype)
         
         while not converged and count<self.num_iterations:
         # Gradient descent
         #for i in range(self.num_iterations):
             #Hypothesis Function
-            linear_model = np.dot(data, self.weights) + self.bias
-            predictions = self.sigmoid(linear_model)
+            if sparse.issparse(data):#one multiply-add per stored value
+                linear_model[:] = data @ self.weights
+            else:
+                np.dot(data, self.weights, out=linear_model)
+            linear_model += self.bias
+
+            # sigmoid(z) = 1 / (1 + e^-|z|) for z >= 0 and 1 - that for z < 0, never overflows
+            np.abs(linear_model, out=exp_neg)
+            np.negative(exp_neg, out=exp_neg)
+            np.exp(exp_neg, out=exp_neg)
+            np.add(exp_neg, 1, out=predictions)
+            np.reciprocal(predictions, out=predictions)
+            np.less(linear_model, 0, out=negative)
+            np.subtract(1, predictions, out=predictions, where=negative)
 
             # Compute gradients
             #∂J/∂w = (1/m) * Σ[(h(x) - y) * x] , ∂J/∂b = (1/m) * Σ(h(x) - y)
 
-            dw = (1/num_samples) * np.dot((predictions - labels),data)
-            db = (1/num_samples) * np.sum(predictions - labels)
+            np.subtract(predictions, labels, out=error)
+            if sparse.issparse(data):
+                dw[:] = data.T @ error
+            else:
+                np.dot(error, data, out=dw)
+            dw /= num_samples
+            db = error.sum() / num_samples
+            if self.l2:
+                penalty = 0.5 * self.l2 * np.dot(self.weights, self.weights)
+                dw += self.l2 * self.weights
+            self.grad_norm = np.sqrt(np.dot(dw, dw) + db * db)
 
             # Update the parameters in the opposite direction of the gradient
             #w := w - α * ∂J/∂w  ,  b := b - α * ∂J/∂b
-            self.weights -= self.learning_rate * dw
+            dw *= self.learning_rate
+            self.weights -= dw
             self.bias -= self.learning_rate * db
-            cost = 0   
             self.iter += 1
-            probabilities = self.sigmoid(linear_model)
-            cost = -1/num_samples * (np.dot(1 - labels, np.log(1 - probabilities + converge)) + np.dot(labels, np.log(probabilities + converge)))
-            
-            if abs(cost1-cost)<=converge:
-                converged = True
-            cost1=cost
             count+=1
+
+            # Cost of the parameters the gradient was taken at: mean(log(1 + e^z) - y*z) with
+            # log(1 + e^z) = max(z, 0) + log(1 + e^-|z|), exact instead of padding the logs with + 0.0001
+            if count % self.cost_every == 0:
+                np.log1p(exp_neg, out=exp_neg)
+                np.maximum(linear_model, 0, out=error)
+                cost = (exp_neg.sum() + error.sum() - np.dot(labels, linear_model)) / num_samples
+                if self.l2:
+                    cost += penalty
+                if abs(cost1-cost) / self.cost_every<=converge: #mean change per iteration
+                    converged = True
+                cost1=cost
             
         return 
+
+    def fit_multinomial(self, data, labels): #softmax regression, every class in one matrix product per iteration
+        data = _as_matrix(data, self.dtype)
+        self.classes, codes = np.unique(labels, return_inverse=True)
+        num_samples, num_features = data.shape
+        num_classes = len(self.classes)
+        if self.warm_start and self.weights is not None and np.shape(self.weights) == (num_features, num_classes):
+            self.weights = np.array(self.weights, dtype=self.dtype)
+            self.bias = np.array(self.bias, dtype=self.dtype)
+        else:
+            self.weights = np.zeros((num_features, num_classes), dtype=self.dtype)
+            self.bias = np.zeros(num_classes, dtype=self.dtype)
+        rows = np.arange(num_samples)
+        converge=0.0001
+        converged = False
+        cost1 = 1
+        count = 0
+        self.iter = 0
+
+        # Buffers reused by every iteration, as in the binary gd loop
+        linear_model = np.empty((num_samples, num_classes), dtype=self.dtype)
+        probabilities = np.empty((num_samples, num_classes), dtype=self.dtype)
+        row_max = np.empty(num_samples, dtype=self.dtype)
+        row_sum = np.empty(num_samples, dtype=self.dtype)
+        dw = np.empty((num_features, num_classes), dtype=self.dtype)
+
+        while not converged and count<self.num_iterations:
+            #Hypothesis Function, Z = XW + b for all classes at once
+            if sparse.issparse(data):
+                linear_model[:] = data @ self.weights
+            else:
+                np.dot(data, self.weights, out=linear_model)
+            linear_model += self.bias
+
+            # softmax(z) = e^(z - max z) / Σ e^(z - max z), shifted so no exponent overflows
+            np.max(linear_model, axis=1, out=row_max)
+            np.subtract(linear_model, row_max[:, None], out=probabilities)
+            np.exp(probabilities, out=probabilities)
+            np.sum(probabilities, axis=1, out=row_sum)
+            probabilities /= row_sum[:, None]
+
+            # Compute gradients, P - Y overwrites P
+            #∂J/∂W = (1/m) * X^T (P - Y) , ∂J/∂b = (1/m) * Σ(P - Y)
+            probabilities[rows, codes] -= 1
+            if sparse.issparse(data):
+                dw[:] = data.T @ probabilities
+            else:
+                np.dot(data.T, probabilities, out=dw)
+            dw /= num_samples
+            db = probabilities.sum(axis=0) / num_samples
+            if self.l2:
+                penalty = 0.5 * self.l2 * np.vdot(self.weights, self.weights)
+                dw += self.l2 * self.weights
+            self.grad_norm = np.sqrt(np.vdot(dw, dw) + np.dot(db, db))
+
+            # Update the parameters in the opposite direction of the gradient
+            dw *= self.learning_rate
+            self.weights -= dw
+            self.bias -= self.learning_rate * db
+            self.iter += 1
+            count+=1
+
+            # Cross entropy of the parameters the gradient was taken at: log Σ e^z - z_y
+            if count % self.cost_every == 0:
+                np.log(row_sum, out=row_sum)
+                cost = (row_max.sum() + row_sum.sum() - linear_model[rows, codes].sum()) / num_samples
+                if self.l2:
+                    cost += penalty
+                if abs(cost1-cost) / self.cost_every<=converge:
+                    converged = True
+                cost1=cost
+
+        return
+
+    def fit_sharded(self, data, labels, n_jobs): #the gd loop of fit with the rows split over worker processes
+        # data and labels go to shared memory once and every worker owns a contiguous shard for the
+        # whole fit. The weights and the per shard gradient and loss sums live in two more shared
+        # buffers, so an iteration only sends every worker a one byte signal and waits for its 
+        # reply; the sums are reduced here exactly as fit would (same update, same convergence test)
+        data = _as_matrix(data, self.dtype)
+        labels = np.asarray(labels, dtype=self.dtype)
+        num_samples, num_features = data.shape
+        self.weights, self.bias = self.start_point(num_features)
+        self.weights = self.weights.astype(self.dtype)
+        converge=0.0001
+        cost1 = 1
+        self.iter = 0
+        shard = -(-num_samples // n_jobs)
+        shards = [(start, min(start + shard, num_samples)) for start in range(0, num_samples, shard)]
+        blocks = []
+        workers = []
+        params = partials = None
+        try:
+            shared = _share(_matrix_bundle(data, labels), blocks)
+            blocks.append(_SharedArray(np.zeros(num_features + 1, dtype=self.dtype)))#weights then bias
+            blocks.append(_SharedArray(np.zeros((len(shards), num_features + 2))))#per shard Σ(p-y)x, Σ(p-y), loss
+            params, partials = (np.ndarray(block.spec.shape, block.spec.dtype, buffer=block.memory.buf) for block in blocks[-2:])
+            for slot, bounds in enumerate(shards):
+                connection, worker_end = Pipe()
+                worker = Process(target=_shard_worker, args=(worker_end, shared, bounds, blocks[-2].spec, blocks[-1].spec, slot), daemon=True)
+                worker.start()
+                worker_end.close()
+                workers.append((worker, connection))
+            while self.iter < self.num_iterations:
+                with_cost = (self.iter + 1) % self.cost_every == 0
+                params[:-1] = self.weights
+                params[-1] = self.bias
+                for worker, connection in workers:
+                    connection.send_bytes(b"c" if with_cost else b"g")
+                for worker, connection in workers:
+                    connection.recv_bytes()#EOFError if a worker died
+                dw = partials[:, :-2].sum(axis=0) / num_samples
+                db = partials[:, -2].sum() / num_samples
+                if self.l2:
+                    penalty = 0.5 * self.l2 * np.dot(self.weights, self.weights)
+                    dw += self.l2 * self.weights
+                self.grad_norm = np.sqrt(np.dot(dw, dw) + db * db)
+
+                #w := w - α * ∂J/∂w  ,  b := b - α * ∂J/∂b
+                self.weights = self.weights - self.learning_rate * dw
+                self.bias -= self.learning_rate * db
+                self.iter += 1
+                if with_cost:
+                    cost = partials[:, -1].sum() / num_samples
+                    if self.l2:
+                        cost += penalty
+                    if abs(cost1-cost) / self.cost_every<=converge:
+                        break
+                    cost1=cost
+        finally:
+            for worker, connection in workers:
+                try:
+                    connection.send_bytes(b"")#stop
+                except OSError:
+                    pass
+                connection.close()
+            for worker, connection in workers:
+                worker.join()
+            del params, partials
+            for block in blocks:
+                block.close()
+
+        return
+
+    def fit_stream(self, chunks): #mini-batch SGD, one pass over the chunks per epoch
+        # chunks: iterable of (data, labels) blocks, e.g. Functions.readFileChunks, or a function
+        # returning a fresh one, which lets a generator over a file larger than memory be
+        # read again for every epoch. Only one chunk is held in memory at a time
+        one_shot = not callable(chunks) and iter(chunks) is chunks
+        if not callable(chunks):
+            if self.epochs > 1 and one_shot:
+                raise ValueError("a generator can only be read once, pass a function returning one for epochs > 1")
+            chunks = (lambda blocks: lambda: blocks)(chunks)
+        if self.scaler is not None and not one_shot: #one streaming pass for the statistics before the first epoch
+            self.scaler.reset()
+            for data, labels in chunks():
+                self.scaler.partial_fit(data)
+        elif self.scaler is not None and self.scaler.scale is None:
+            raise ValueError("a generator can only be read once, fit the scaler first or pass a function returning one")
+        rng = np.random.default_rng(self.random_state)
+        started = False
+        converge = 0.0001
+        cost1 = 1
+        self.iter = 0
+
+        for epoch in range(self.epochs):
+            rate = self.rate(epoch)
+            cost = 0
+            seen = 0
+            for data, labels in chunks():
+                data = _as_matrix(data) if self.scaler is None else self.scaler.transform(data)
+                labels = np.asarray(labels, dtype=float)
+                if not started:
+                    self.weights, self.bias = self.start_point(data.shape[1])
+                    started = True
+                if self.shuffle:
+                    order = rng.permutation(data.shape[0])
+                    data, labels = data[order], labels[order]
+                for start in range(0, data.shape[0], self.batch_size):
+                    batch = data[start:start + self.batch_size]
+                    batch_labels = labels[start:start + self.batch_size]
+                    linear_model = batch @ self.weights + self.bias
+                    exp_neg = np.exp(-np.abs(linear_model)) #same overflow free sigmoid and loss as the gd loop of fit
+                    predictions = 1 / (1 + exp_neg)
+                    np.subtract(1, predictions, out=predictions, where=linear_model < 0)
+
+                    # Same gradients as fit, averaged over the mini-batch only
+                    error = predictions - batch_labels
+                    dw = batch.T @ error / len(batch_labels)
+                    if self.l2:
+                        dw += self.l2 * self.weights
+                        cost += 0.5 * self.l2 * np.dot(self.weights, self.weights) * len(batch_labels)
+
+                    # Epoch cost from the predictions made before each update, no extra pass
+                    cost += np.log1p(exp_neg).sum() + np.maximum(linear_model, 0).sum() - np.dot(batch_labels, linear_model)
+                    self.weights -= rate * dw
+                    self.bias -= rate * np.sum(error) / len(batch_labels)
+                seen += data.shape[0]
+            if seen == 0:
+                raise ValueError("fit_stream got no rows")
+            cost /= seen
+            self.iter += 1
+            if abs(cost1-cost)<=converge:
+                break
+            cost1=cost
+
+        return
+
+    def fit_newton(self, data, labels): #Newton/IRLS, one (features+1)^2 linear solve per iteration
+        data = _as_matrix(data)
+        labels = np.asarray(labels, dtype=float)
+        num_samples, num_features = data.shape
+        theta = np.append(*self.start_point(num_features)) #weights then bias
+        cost, grad, predictions = self.cost_gradient(theta, data, labels, self.l2)
+        self.iter = 0
+
+        while self.iter < self.num_iterations and np.linalg.norm(grad) > _GRAD_TOL:
+            # Hessian of the mean log loss: X^T S X / m with S = p(1-p), bias as a column of ones
+            curvature = predictions * (1 - predictions) / num_samples
+            hessian = np.empty((num_features + 1, num_features + 1))
+            if sparse.issparse(data):
+                hessian[:-1, :-1] = (data.T @ sparse.diags(curvature) @ data).toarray()
+            else:
+                hessian[:-1, :-1] = np.dot(data.T * curvature, data)
+            hessian[:-1, -1] = hessian[-1, :-1] = data.T @ curvature
+            hessian[-1, -1] = curvature.sum()
+            hessian[np.arange(num_features), np.arange(num_features)] += self.l2
+            hessian[np.diag_indices_from(hessian)] += 1e-12 * (1 + hessian.trace()) #saturated rows make it singular
+            direction = -np.linalg.solve(hessian, grad)
+            cost1 = cost
+            theta, (cost, grad, predictions) = self.line_search(theta, cost, grad, direction, data, labels, self.l2)
+            self.iter += 1
+            if cost1 - cost <= _STALL_TOL:
+                break
+
+        self.weights, self.bias = theta[:-1], theta[-1]
+        self.grad_norm = np.linalg.norm(grad)
+
+    def fit_lbfgs(self, data, labels): #L-BFGS, O(features) memory per stored curvature pair
+        labels = np.asarray(labels, dtype=float)
+        # Unlike Newton, L-BFGS is slowed down by badly scaled columns (adult fnlwgt), so it runs 
+        # on standardized columns and the weights are mapped back at the end (same optimum)
+        data = _as_matrix(data)
+        if sparse.issparse(data):#scale only, centering would fill in every zero
+            mean = np.zeros(data.shape[1])
+            std = np.sqrt(np.asarray(data.multiply(data).mean(axis=0)).ravel())
+            std[std == 0] = 1
+            data = data @ sparse.diags(1 / std)
+        else:
+            mean = data.mean(axis=0)
+            std = data.std(axis=0)
+            std[std == 0] = 1
+            data = (data - mean) / std
+        weights, bias = self.start_point(data.shape[1])
+        theta = np.append(weights * std, bias + np.dot(weights, mean)) #weights then bias, standardized
+        penalty = self.l2 / std**2 #l2/2 * |weights|^2 of the original weights
+        cost, grad, _ = self.cost_gradient(theta, data, labels, penalty)
+        steps, changes = [], [] #last _LBFGS_MEMORY pairs of theta and gradient differences
+        self.iter = 0
+
+        while self.iter < self.num_iterations and np.linalg.norm(grad) > _GRAD_TOL:
+            # Two loop recursion: direction = -H grad for the inverse Hessian estimate H
+            direction = -grad
+            alphas = []
+            for step, change in zip(reversed(steps), reversed(changes)):
+                alpha = np.dot(step, direction) / np.dot(change, step)
+                direction -= alpha * change
+                alphas.append(alpha)
+            if steps:
+                direction *= np.dot(steps[-1], changes[-1]) / np.dot(changes[-1], changes[-1])
+            else:
+                direction /= max(1.0, np.linalg.norm(grad)) #no curvature yet: a short first step
+            for step, change, alpha in zip(steps, changes, reversed(alphas)):
+                beta = np.dot(change, direction) / np.dot(change, step)
+                direction += (alpha - beta) * step
+
+            cost1, grad1 = cost, grad
+            new_theta, (cost, grad, _) = self.line_search(theta, cost, grad, direction, data, labels, penalty)
+            step, change = new_theta - theta, grad - grad1
+            theta = new_theta
+            if np.dot(step, change) > 1e-12: #keep the estimate positive definite
+                steps.append(step)
+                changes.append(change)
+                if len(steps) > _LBFGS_MEMORY:
+                    steps.pop(0)
+                    changes.pop(0)
+            self.iter += 1
+            if cost1 - cost <= _STALL_TOL:
+                break
+
+        self.weights = theta[:-1] / std
+        self.bias = theta[-1] - np.dot(self.weights, mean)
+        grad[:-1] = grad[:-1] * std + grad[-1] * mean #gradient in the original coordinates
+        self.grad_norm = np.linalg.norm(grad)
+
+    def cost_gradient(self, theta, data, labels, penalty=0): #mean log loss (+ penalty/2 * |weights|^2), its gradient and the predictions at theta = [weights, bias]
+        linear_model = data @ theta[:-1] + theta[-1]
+        predictions = self.sigmoid(linear_model)
+        error = predictions - labels
+        grad = np.append(data.T @ error, np.sum(error)) / len(labels)
+        grad[:-1] += penalty * theta[:-1]
+        return _log_loss(linear_model, labels) + 0.5 * np.dot(penalty * theta[:-1], theta[:-1]), grad, predictions
+
+    def line_search(self, theta, cost, grad, direction, data, labels, penalty=0): #backtracking until the cost drops enough (Armijo)
+        slope = np.dot(grad, direction)
+        if slope >= 0: #not a descent direction, fall back to the gradient
+            direction, slope = -grad, -np.dot(grad, grad)
+        step = 1.0
+        while True:
+            candidate = theta + step * direction
+            result = self.cost_gradient(candidate, data, labels, penalty)
+            if result[0] <= cost + 1e-4 * step * slope or step < 1e-12:
+                return candidate, result
+            step /= 2
+
+    def start_point(self, num_features): #initial (weights, bias): zeros, or a copy of the current fit with warm_start
+        if self.warm_start and self.weights is not None and len(self.weights) == num_features:
+            return np.array(self.weights, dtype=float), float(self.bias)
+        return np.zeros(num_features), 0.0
+
+    def rate(self, epoch): #learning rate of an sgd epoch under self.schedule
+        if self.schedule == "inverse":
+            return self.learning_rate / (1 + self.decay * epoch)
+        if self.schedule == "exponential":
+            return self.learning_rate * np.exp(-self.decay * epoch)
+        return self.learning_rate
         
-    def k_fold (self, data, labels, k):
+    def k_fold (self, data, labels, k, n_jobs=1):
+        # n_jobs > 1: folds run concurrently in worker processes, each fitting its own copy of the
+        # model on data placed in shared memory once (self is left unfitted). -1 for one per CPU
+        n_jobs = os.cpu_count() if n_jobs == -1 else (n_jobs or 1)
+        if n_jobs > 1:
+            return self.parallel_k_fold(data, labels, k, n_jobs)
         accuracies = []
         iterations = []
-        index_length = len(data)//k
-        counter = 0
         
-        for i in range(k):
-            if i == k-1:
-                data_testing_set = data[counter:]
-                data_training_set = data[:counter]
-                label_testing_set = labels[counter:]
-                label_training_set = labels[:counter]
-                
-            else:
-                data_testing_set = data[counter:index_length+counter]
-                label_testing_set = labels[counter:index_length+counter]
-                if counter == 0:
-                    data_training_set = data[index_length+1:]
-                    label_training_set = labels[index_length+1:]
-                else:
-                    data_training_set = np.concatenate((data[0:counter] , data[index_length+counter+1:]))
-                    label_training_set = np.concatenate((labels[0:counter] , labels[index_length+counter+1:]))
-                    
-            counter+=index_length
-            self.fit(np.array(data_training_set),np.array(label_training_set))
-            labels_pred = self.predict(np.array(data_testing_set))
-            accuracy = self.evaluate_acc(np.array(label_testing_set),np.array(labels_pred))
+        for data_training_set, label_training_set, data_testing_set, label_testing_set in self.fold_split(data, labels, k):
+            self.fit(data_training_set, label_training_set)
+            labels_pred = self.predict(data_testing_set)
+            accuracy = self.evaluate_acc(label_testing_set, np.array(labels_pred))
             accuracies.append(accuracy)
             iterations.append(self.iter)
         
         return accuracies, iterations
+
+    def parallel_k_fold(self, data, labels, k, n_jobs): #k_fold over a process pool, results in fold order
+        model = copy.copy(self)
+        model.weights = model.bias = None
+        model.n_jobs = 1 #the folds already use the worker processes
+        blocks = []
+        try:
+            data = _as_matrix(data)
+            shared = _share(_matrix_bundle(data, np.asarray(labels)), blocks)
+            with ProcessPoolExecutor(min(n_jobs, k), initializer=_fold_worker_init, initargs=(model, shared)) as pool:
+                results = list(pool.map(_lr_worker_fold, self.fold_bounds(data.shape[0], k)))
+        finally:
+            for block in blocks:
+                block.close()
+        return [accuracy for accuracy, _ in results], [iterations for _, iterations in results]
+
+    def k_fold_path(self, data, labels, k, settings):
+        # settings: list of dicts of attributes to apply in turn, e.g. [{"l2": 1.0}, {"l2": 0.1}] or 
+        # [{"learning_rate": 0.1}, {"learning_rate": 0.01}]. Every fold fits them in order, each 
+        # starting from the previous solution (order an l2 path from strong to weak), which needs
+        # far fewer iterations than fitting every setting from zeros
+        # returns (k, len(settings)) grids of accuracies and iterations
+        for setting in settings:
+            for name in setting:
+                if not hasattr(self, name):
+                    raise ValueError(f"LogisticRegression has no setting {name!r}")
+        accuracies = np.zeros((k, len(settings)))
+        iterations = np.zeros((k, len(settings)), dtype=int)
+        saved = {name: getattr(self, name) for setting in settings for name in setting}
+        saved["warm_start"] = self.warm_start
+        try:
+            for i, (data_training_set, label_training_set, data_testing_set, label_testing_set) in enumerate(self.fold_split(data, labels, k)):
+                self.weights = None #the first setting of every fold starts from zeros
+                self.warm_start = True
+                for j, setting in enumerate(settings):
+                    for name, value in setting.items():
+                        setattr(self, name, value)
+                    self.fit(data_training_set, label_training_set)
+                    labels_pred = self.predict(data_testing_set)
+                    accuracies[i, j] = self.evaluate_acc(np.array(label_testing_set), np.array(labels_pred))
+                    iterations[i, j] = self.iter
+        finally:
+            for name, value in saved.items():
+                setattr(self, name, value)
+
+        return accuracies, iterations
+
+    def fold_split(self, data, labels, k): #yields (train data, train labels, test data, test labels) per fold
+        data = data if sparse.issparse(data) else np.asarray(data)
+        labels = np.asarray(labels)
+        for start, stop in self.fold_bounds(data.shape[0], k):
+            train = np.ones(data.shape[0], dtype=bool)
+            train[start:stop] = False #every row outside the test fold trains, one copy
+            yield data[train], labels[train], data[start:stop], labels[start:stop]
+
+    def fold_bounds(self, num_samples, k): #[start, stop) of every test fold, the last one takes the remainder
+        index_length = num_samples//k
+        return [(i * index_length, num_samples if i == k-1 else (i+1) * index_length) for i in range(k)]
             
     def predict(self, data):
+        if self.scaler is not None:
+            data = self.scaler.transform(data)
         #Hypothesis Function
-        linear_model = np.dot(data, self.weights) + self.bias
+        linear_model = data @ self.weights + self.bias
+        if self.multi_class == "multinomial":
+            return self.classes[np.argmax(linear_model, axis=1)] #softmax keeps the order of the scores
         predictions = self.sigmoid(linear_model)
-        return [1 if p >= 0.5 else 0 for p in predictions]
+        return np.where(predictions >= 0.5, 1, 0) #one vectorized pass, also over large served batches
+
+    def predict_proba(self, data): #probability of every class, columns in the order of self.classes ([0, 1] for binary)
+        if self.scaler is not None:
+            data = self.scaler.transform(data)
+        linear_model = data @ self.weights + self.bias
+        if self.multi_class == "binary":
+            predictions = self.sigmoid(linear_model)
+            return np.column_stack((1 - predictions, predictions))
+        linear_model -= linear_model.max(axis=1, keepdims=True)
+        np.exp(linear_model, out=linear_model)
+        linear_model /= linear_model.sum(axis=1, keepdims=True)
+        return linear_model
+
+    def save(self, path, source=None): #weights, bias, classes and scaler as .npy files plus a meta.json with the settings (and source, see kNN.save)
+        if self.weights is None:
+            raise ValueError("fit the model before saving it")
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "weights.npy"), np.asarray(self.weights), allow_pickle=False)
+        np.save(os.path.join(path, "bias.npy"), np.asarray(self.bias), allow_pickle=False)
+        if self.classes is not None:
+            np.save(os.path.join(path, "classes.npy"), np.asarray(np.asarray(self.classes).tolist()), allow_pickle=False)
+        meta = {
+            "format_version": _FORMAT_VERSION,
+            "model": type(self).__name__,
+            "settings": {name: getattr(self, name) for name in _LR_SETTINGS},
+            "learning_rate": self.learning_rate,
+            "num_iterations": self.num_iterations,
+            "iter": int(self.iter),
+            "scaler": _save_scaler(self.scaler, path),
+            "source": source or self.source,
+        }
+        with open(os.path.join(path, "meta.json"), "w") as file:
+            json.dump(meta, file, indent=1, default=lambda value: value.item() if isinstance(value, np.generic) else str(value))
+
+    @classmethod
+    def load(cls, path): #model written by save, ready for predict (or fit with warm_start)
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+        if meta.get("format_version") != _FORMAT_VERSION or meta.get("model") != cls.__name__:
+            raise ValueError(f"{path} holds {meta.get('model', 'kNN')} format {meta.get('format_version')}, expected {cls.__name__} format {_FORMAT_VERSION}")
+        model = cls(**meta["settings"])
+        model.set_learning_rate(meta["learning_rate"])
+        model.num_iterations = meta["num_iterations"]
+        model.iter = meta["iter"]
+        model.weights = np.load(os.path.join(path, "weights.npy"))
+        model.bias = np.load(os.path.join(path, "bias.npy"))
+        if model.bias.ndim == 0:
+            model.bias = model.bias.item()
+        if os.path.exists(os.path.join(path, "classes.npy")):
+            model.classes = np.load(os.path.join(path, "classes.npy"))
+        model.scaler = _load_scaler(path, meta.get("scaler"))
+        model.source = meta.get("source")
+        return model
 
     def evaluate_acc(self, label_true, label_pred):
         correct = np.sum(label_true == label_pred)
@@ -116,59 +878,1236 @@ class LogisticRegression:
 # 3) assunming we have 2 unique classifications (a,b). we take the classification of the dominant group
 # 4) if a tie exists take the class with the shortest distance from 
 
-#to calculate distance we can use the Euclidean distance formula sqrt(sum i to N (x1_i — x2_i)²)
+#to calculate distance we can use the Euclidean distance formula sqrt(sum i to N (x1_i — x2_i)²)
+
+_QUERY_BLOCK = 1024 #rows of new data whose distances are computed together in kNN.predict
+_BYTES_PER_PAIR = 32 #peak bytes per (query row, train row) distance, incl. matmul and selection temporaries
+_REBUILD_FRACTION = 0.1 #kNN.partial_fit rebuilds the index once this share of rows is unindexed
+_COMPACT_FRACTION = 0.25 #kNN.remove compacts once this share of rows is flagged as removed
+_MIN_JOB_ROWS = 256 #fewest query rows worth sending to a worker process
+_MIN_TRAIN_TILE = 256 #smallest train tile before max_memory shrinks the query tile instead
+_KMEANS_ITERATIONS = 20 #maximum Lloyd iterations when training the coarse quantizer of index="ivf"
+_KMEANS_SAMPLE_PER_LIST = 64 #training rows sampled per cell to fit that quantizer
+
+
+def _smallest_k(distances, k, indices=None):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    select the k smallest distances of every row with a partial sort. Between equal 
+    distances at the k-th place the larger training indices are kept, as the heap of 
+    the original row by row search did, so every search path keeps the same neighbours.
+    Results are ordered by distance, and equal distances by index
+    ===================================================================================
+    PARAMETERS:
+    ===================================================================================
+    * distances (NumPy Array):
+    ----------------------------------------
+    (rows, candidates) matrix of distances
+    ----------------------------------------
+    * k (int):
+    ----------------------------------------
+    number of neighbours to keep per row
+    ----------------------------------------
+    * indices (NumPy Array):
+    ----------------------------------------
+    training index of every candidate, defaults to the column number
+    ===================================================================================
+    RETURNS:
+    ===================================================================================
+    * k_distances, k_indices (NumPy Arrays):
+    ----------------------------------------
+    two (rows, k) arrays, nearest first
+    ===================================================================================
+    '''
+    in_column_order = indices is None
+    if in_column_order:
+        indices = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+    k = min(k, distances.shape[1])
+    if k < distances.shape[1]:
+        chosen = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        kth = np.take_along_axis(distances, chosen, 1).max(axis=1)
+        #argpartition picks arbitrarily between equal distances at the k-th place, redo those rows keeping the larger indices
+        tied = np.flatnonzero((distances <= kth[:, None]).sum(axis=1) > k)
+        if len(tied) and in_column_order:
+            #keep everything closer than the k-th distance, then the last columns equal to it
+            closer = distances[tied] < kth[tied, None]
+            equal = distances[tied] == kth[tied, None]
+            needed = k - closer.sum(axis=1)
+            keep = closer | (equal & (np.cumsum(equal[:, ::-1], axis=1)[:, ::-1] <= needed[:, None]))
+            chosen[tied] = np.nonzero(keep)[1].reshape(len(tied), k)
+        elif len(tied):
+            chosen[tied] = np.lexsort((-indices[tied], distances[tied]))[:, :k]
+    else:
+        chosen = np.broadcast_to(np.arange(k), distances.shape)
+    k_distances = np.take_along_axis(distances, chosen, 1)
+    k_indices = np.take_along_axis(indices, chosen, 1)
+    order = np.lexsort((k_indices, k_distances))
+    return np.take_along_axis(k_distances, order, 1), np.take_along_axis(k_indices, order, 1)
+
+
+def _merge_k(distances, indices, other_distances, other_indices, k):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    merge two sorted neighbour lists of the same query rows into the k best (larger 
+    index first between equal distances, as _smallest_k), ordered by distance then 
+    index. Both sides are already short (at most k columns), so a sort of the joined 
+    columns is cheap
+    ===================================================================================
+    '''
+    distances = np.hstack((distances, other_distances))
+    indices = np.hstack((indices, other_indices))
+    kept = np.lexsort((-indices, distances))[:, :k]
+    distances, indices = np.take_along_axis(distances, kept, 1), np.take_along_axis(indices, kept, 1)
+    order = np.lexsort((indices, distances))
+    return np.take_along_axis(distances, order, 1), np.take_along_axis(indices, order, 1)
+
+
+class _Growable:
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    array with spare capacity along one axis (rows, or columns for the transposed 
+    hamming words) so appending n rows costs O(n) amortized instead of a full copy
+    ===================================================================================
+    '''
+    def __init__(self, array, axis=0):
+        self.axis = axis
+        self.buffer = array
+        self.size = array.shape[axis]
+
+    def __slice(self, start, stop):
+        return (slice(None),) * self.axis + (slice(start, stop),)
+
+    @property
+    def view(self):
+        return self.buffer[self.__slice(0, self.size)]
+
+    def append(self, rows):
+        needed = self.size + rows.shape[self.axis]
+        dtype = np.promote_types(self.buffer.dtype, rows.dtype)#e.g. a longer label string
+        if needed > self.buffer.shape[self.axis] or dtype != self.buffer.dtype:
+            shape = list(self.buffer.shape)
+            shape[self.axis] = max(needed, 2 * shape[self.axis])#doubling keeps appends amortized
+            grown = np.empty(shape, dtype)
+            grown[self.__slice(0, self.size)] = self.view
+            self.buffer = grown
+        self.buffer[self.__slice(self.size, needed)] = rows
+        self.size = needed
+
+
+def _lp_norm(differences, p):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    minkowski norm of order p along the last axis (p=2 euclidean, p=1 manhattan, 
+    p=inf chebyshev). Used for a row against many rows by the tree and ivf indexes
+    ===================================================================================
+    '''
+    if p == 2:
+        return np.sqrt(np.einsum("...i,...i->...", differences, differences))
+    differences = np.abs(differences)
+    if p == 1:
+        return differences.sum(axis=-1)
+    if p == np.inf:
+        return differences.max(axis=-1)
+    return (differences ** p).sum(axis=-1) ** (1 / p)
+
+
+class _SpatialTree:
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    exact nearest neighbour index shared by _KDTree and _BallTree. Training rows are 
+    split recursively on their widest feature (median split) until a node holds at most
+    leaf_size rows; a query then walks the tree nearest child first and skips every 
+    node whose bound is already farther than the current k-th neighbour
+    ===================================================================================
+    '''
+    def __init__(self, data, leaf_size=40, p=2):
+        self.leaf_size = max(1, leaf_size)
+        self.p = p #order of the minkowski distance, any p >= 1 is a true metric so the bounds hold
+        self.order = np.arange(len(data)) #training index of every row in tree order
+        self.starts, self.ends, self.children = [], [], []
+        self.bounds = []
+        stack = [(0, len(data), None)]
+        while stack:
+            start, end, parent = stack.pop()
+            node = len(self.starts)
+            if parent is not None:
+                self.children[parent[0]][parent[1]] = node
+            rows = data[self.order[start:end]]
+            self.starts.append(start)
+            self.ends.append(end)
+            self.children.append([-1, -1])
+            self.bounds.append(self._bound(rows))
+            spread = rows.max(axis=0).astype(float) - rows.min(axis=0)#float so int8 storage can not wrap
+            if end - start <= self.leaf_size or spread.max() == 0:#small enough, or every row identical
+                continue
+            dim = np.argmax(spread)
+            mid = (end - start) // 2
+            split = np.argpartition(rows[:, dim], mid)
+            self.order[start:end] = self.order[start:end][split]
+            stack.append((start + mid, end, (node, 1)))
+            stack.append((start, start + mid, (node, 0)))
+        self.data = data[self.order] #rows stored in tree order so every leaf is one contiguous slice
+
+    def _state(self):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        arrays and scalar settings that rebuild this tree through _restore (kNN.save)
+        ===================================================================================
+        '''
+        low, high = zip(*self.bounds)#box corners, or centroids and radii
+        arrays = {"order": self.order, "data": self.data, "starts": np.asarray(self.starts), 
+                  "ends": np.asarray(self.ends), "children": np.asarray(self.children),
+                  "bound_low": np.asarray(low), "bound_high": np.asarray(high)}
+        return arrays, {"leaf_size": self.leaf_size, "p": self.p}
+
+    @classmethod
+    def _restore(cls, arrays, settings):
+        tree = cls.__new__(cls)
+        tree.leaf_size, tree.p = settings["leaf_size"], settings["p"]
+        tree.order, tree.data = arrays["order"], arrays["data"]
+        #the walk indexes these one node at a time, which is quicker on lists
+        tree.starts, tree.ends = arrays["starts"].tolist(), arrays["ends"].tolist()
+        tree.children = arrays["children"].tolist()
+        tree.bounds = list(zip(arrays["bound_low"], arrays["bound_high"]))
+        return tree
+
+    def query(self, rows, k, alive=None):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        return the distances and training indices of the k nearest rows of every query, 
+        ordered by distance, then by index (same neighbours and order as _smallest_k). Rows whose alive 
+        flag is False (removed since the build) are skipped; when fewer than k rows are 
+        left the results are padded with distance inf and index -1
+        ===================================================================================
+        '''
+        k = min(k, len(self.data))
+        k_distances = np.full((len(rows), k), np.inf)
+        k_indices = np.full((len(rows), k), -1, dtype=np.intp)
+        live = None if alive is None else alive[self.order]
+        for r, row in enumerate(rows):
+            best = []#heap of [-distance, index] so the current worst neighbour (farthest, then smallest index) is on top
+            stack = [(self._min_distance(0, row), 0)]
+            while stack:
+                bound, node = stack.pop()
+                if len(best) == k and bound > -best[0][0]:
+                    continue #nothing in this node can beat the current k-th neighbour
+                left, right = self.children[node]
+                if left == -1:
+                    start, end = self.starts[node], self.ends[node]
+                    distances = _lp_norm(self.data[start:end] - row, self.p)
+                    if len(best) == k:
+                        candidates = distances <= -best[0][0]
+                    else:
+                        candidates = np.ones(end - start, dtype=bool)
+                    if live is not None:
+                        candidates &= live[start:end]
+                    candidates = np.flatnonzero(candidates)
+                    for c in candidates:
+                        item = (-distances[c], self.order[start + c])
+                        if len(best) < k:
+                            heapq.heappush(best, item)
+                        elif item > best[0]:
+                            heapq.heapreplace(best, item)
+                    continue
+                left_bound, right_bound = self._min_distance(left, row), self._min_distance(right, row)
+                if left_bound <= right_bound:#push the farther child first so the nearer one is searched first
+                    stack.append((right_bound, right))
+                    stack.append((left_bound, left))
+                else:
+                    stack.append((left_bound, left))
+                    stack.append((right_bound, right))
+            best.sort(key=lambda item: (-item[0], item[1]))
+            k_distances[r, :len(best)] = [-d for d, i in best]
+            k_indices[r, :len(best)] = [i for d, i in best]
+        return k_distances, k_indices
+
+
+class _KDTree(_SpatialTree):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    _SpatialTree bounding every node with an axis aligned box, tight in low dimensions
+    ===================================================================================
+    '''
+    def _bound(self, rows):
+        return rows.min(axis=0), rows.max(axis=0)
+
+    def _min_distance(self, node, row):
+        low, high = self.bounds[node]
+        gap = np.maximum(low - row, 0.0) + np.maximum(row - high, 0.0)
+        return _lp_norm(gap, self.p)
+
+
+class _BallTree(_SpatialTree):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    _SpatialTree bounding every node with a centroid and radius, which keeps pruning 
+    useful in more dimensions than a box does
+    ===================================================================================
+    '''
+    def _bound(self, rows):
+        centroid = rows.mean(axis=0)
+        return centroid, _lp_norm(rows - centroid, self.p).max()
+
+    def _min_distance(self, node, row):
+        centroid, radius = self.bounds[node]
+        return max(0.0, _lp_norm(row - centroid, self.p) - radius)
+
+
+class _IVFIndex:
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    approximate nearest neighbour index (inverted file). k-means splits the training 
+    rows into n_lists cells; a query only scans the rows of the n_probe cells whose 
+    centroids are nearest to it, so more probes trade speed for recall
+    ===================================================================================
+    '''
+    def __init__(self, data, n_lists=None, n_probe=4, random_state=None, p=2):
+        self.p = p #cells are always euclidean k-means, the scan inside them uses this minkowski order
+        n_lists = n_lists or max(1, int(sqrt(len(data))))
+        self.n_lists = min(n_lists, len(data))
+        self.n_probe = n_probe
+        self.centroids = self.__kMeans(data, np.random.default_rng(random_state))
+        cells = np.argmin(self.__centroidDistances(data), axis=1)
+        self.order = np.argsort(cells, kind="stable") #training index of every row, grouped by cell
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(cells, minlength=self.n_lists))))
+        self.data = data[self.order]
+
+    def _state(self):
+        arrays = {"centroids": self.centroids, "order": self.order, "offsets": self.offsets, "data": self.data}
+        return arrays, {"p": self.p, "n_lists": self.n_lists, "n_probe": self.n_probe}
+
+    @classmethod
+    def _restore(cls, arrays, settings):
+        index = cls.__new__(cls)
+        index.__dict__.update(arrays)
+        index.__dict__.update(settings)
+        return index
+
+    def __centroidDistances(self, rows):
+        rows = np.asarray(rows, dtype=float)#compact (uint8/int8) storage would overflow the squares
+        squared = np.einsum("ij,ij->i", rows, rows)[:, None] + np.einsum("ij,ij->i", self.centroids, self.centroids)[None, :]
+        squared -= 2.0 * (rows @ self.centroids.T)
+        return np.maximum(squared, 0.0, out=squared)
+
+    def __kMeans(self, data, rng):
+        if len(data) > _KMEANS_SAMPLE_PER_LIST * self.n_lists:#a sample is enough to place the centroids
+            data = data[rng.choice(len(data), _KMEANS_SAMPLE_PER_LIST * self.n_lists, replace=False)]
+        data = np.asarray(data, dtype=float)
+        self.centroids = data[rng.choice(len(data), self.n_lists, replace=False)].copy()
+        for _ in range(_KMEANS_ITERATIONS):
+            cells = np.argmin(self.__centroidDistances(data), axis=1)
+            counts = np.bincount(cells, minlength=self.n_lists)
+            sums = np.stack([np.bincount(cells, weights=column, minlength=self.n_lists) for column in data.T], axis=1)
+            filled = counts > 0 #an empty cell keeps its previous centroid
+            moved = sums[filled] / counts[filled, None]
+            if np.allclose(moved, self.centroids[filled]):
+                break
+            self.centroids[filled] = moved
+        return self.centroids
+
+    def query(self, rows, k, alive=None):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        return the distances and training indices of the k nearest rows found in the 
+        probed cells of every query. Extra cells are probed when the first n_probe hold 
+        fewer than k live rows (alive as in _SpatialTree.query, padded the same way)
+        ===================================================================================
+        '''
+        k = min(k, len(self.data))
+        k_distances = np.full((len(rows), k), np.inf)
+        k_indices = np.full((len(rows), k), -1, dtype=np.intp)
+        cell_order = np.argsort(self.__centroidDistances(rows), axis=1)
+        live = np.ones(len(self.data), dtype=bool) if alive is None else alive[self.order]
+        running = np.concatenate(([0], np.cumsum(live)))
+        sizes = running[self.offsets[1:]] - running[self.offsets[:-1]]#live rows per cell
+        for r, row in enumerate(rows):
+            probes = max(self.n_probe, np.searchsorted(np.cumsum(sizes[cell_order[r]]), k) + 1)
+            cells = cell_order[r, :probes]
+            positions = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in cells])
+            positions = positions[live[positions]]
+            distances = _lp_norm(self.data[positions] - row, self.p)
+            found_distances, found_indices = _smallest_k(distances[None, :], k, self.order[positions][None, :])
+            k_distances[r, :found_distances.shape[1]] = found_distances[0]
+            k_indices[r, :found_indices.shape[1]] = found_indices[0]
+        return k_distances, k_indices
+
+
+_SharedSpec = namedtuple("_SharedSpec", ["name", "shape", "dtype"])
+
+
+class _SharedArray:
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    copy a NumPy array into multiprocessing.shared_memory once, so worker processes map
+    the same pages instead of each receiving a pickled copy. The owner must close() it
+    ===================================================================================
+    '''
+    def __init__(self, array):
+        self.memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.spec = _SharedSpec(self.memory.name, array.shape, array.dtype.str)
+        np.ndarray(array.shape, array.dtype, buffer=self.memory.buf)[...] = array
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+_SHARE_MIN_BYTES = 1 << 16 #smaller arrays are cheaper to pickle than to map
+_WORKER_STATE = {} #per worker process: the attached model and its shared memory handles
+
+
+def _share(obj, blocks):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    return a shallow copy of obj whose large numeric array attributes are moved into 
+    shared memory and replaced by a _SharedSpec. New _SharedArray blocks are appended to
+    blocks so the caller can release them
+    ===================================================================================
+    '''
+    shell = copy.copy(obj)
+    for name, value in vars(obj).items():
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject and value.nbytes >= _SHARE_MIN_BYTES:
+            block = _SharedArray(value)
+            blocks.append(block)
+            setattr(shell, name, block.spec)
+    return shell
+
+
+def _attach(shell, handles):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    inverse of _share inside a worker: replace every _SharedSpec attribute of shell by a 
+    read only array over the shared memory (handles keeps the mappings alive)
+    ===================================================================================
+    '''
+    for name, value in vars(shell).items():
+        if isinstance(value, _SharedSpec):
+            memory = shared_memory.SharedMemory(name=value.name)
+            handles.append(memory)
+            array = np.ndarray(value.shape, np.dtype(value.dtype), buffer=memory.buf)
+            array.flags.writeable = False
+            setattr(shell, name, array)
+    return shell
+
+
+def _worker_init(model, queries):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    process pool initializer for kNN.kNeighbours(n_jobs > 1): attach the shared model 
+    (and its index) and the shared query rows once per worker
+    ===================================================================================
+    '''
+    handles = []
+    model = _attach(model, handles)
+    if model.tree is not None:
+        model.tree = _attach(model.tree, handles)
+    _WORKER_STATE.update(model=model, handles=handles, queries=_attach(queries, handles).rows)
+
+
+def _fold_worker_init(model, folds):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    process pool initializer for kNN.kFoldCross and LogisticRegression.k_fold (n_jobs > 1):
+    attach the unfitted model and the shared values/labels of the whole data set once 
+    per worker
+    ===================================================================================
+    '''
+    handles = []
+    _WORKER_STATE.update(model=model, handles=handles, folds=_attach(folds, handles))
+
+
+def _worker_fold(test):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    process pool task: fit on every row except the test indices, return the accuracy
+    ===================================================================================
+    '''
+    model, folds = _WORKER_STATE["model"], _WORKER_STATE["folds"]
+    train = np.ones(len(folds.values), dtype=bool)
+    train[test] = False
+    model.fit(folds.values[train], folds.labels[train])
+    return model.evaluate_acc(model.predict(folds.values[test]), folds.labels[test], False)
+
+
+def _lr_worker_fold(bounds):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    process pool task for LogisticRegression.k_fold: fit a fresh copy of the model on 
+    every row outside the test fold [start, stop), return (accuracy, iterations)
+    ===================================================================================
+    '''
+    folds = _WORKER_STATE["folds"]
+    model = copy.copy(_WORKER_STATE["model"])#nothing is shared between folds of one worker
+    values = _bundle_matrix(folds)
+    start, stop = bounds
+    train = np.ones(values.shape[0], dtype=bool)
+    train[start:stop] = False
+    model.fit(values[train], folds.labels[train])
+    predictions = model.predict(values[start:stop])
+    return model.evaluate_acc(folds.labels[start:stop], np.array(predictions)), model.iter
+
+
+def _shard_worker(connection, shards, bounds, params, partials, slot):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    worker process of LogisticRegression.fit_sharded, alive for one whole fit. Attach 
+    the shared training values/labels, the shared weights and the shared result rows 
+    once, then for every signal ("g" gradient, "c" gradient and cost, empty to stop) 
+    write the sums of (p - y) * x, of (p - y) and of the log loss over the rows 
+    [start, stop) into result row slot and reply with one byte
+    ===================================================================================
+    '''
+    handles = []
+    shards = _attach(shards, handles)
+    values = _bundle_matrix(shards)#sparse shards are rebuilt once, not every iteration
+    start, stop = bounds
+    data, labels = values[start:stop], shards.labels[start:stop]
+    memory = shared_memory.SharedMemory(name=params.name)
+    handles.append(memory)
+    params = np.ndarray(params.shape, np.dtype(params.dtype), buffer=memory.buf)
+    memory = shared_memory.SharedMemory(name=partials.name)
+    handles.append(memory)
+    result = np.ndarray(partials.shape, np.dtype(partials.dtype), buffer=memory.buf)[slot]
+    try:
+        while True:
+            try:
+                signal = connection.recv_bytes()
+            except EOFError:#the fit ended without a stop signal
+                break
+            if not signal:
+                break
+            linear_model = data @ params[:-1] + params[-1]
+            exp_neg = np.exp(-np.abs(linear_model))#same overflow free sigmoid and loss as the gd loop of fit
+            predictions = 1 / (1 + exp_neg)
+            np.subtract(1, predictions, out=predictions, where=linear_model < 0)
+            error = predictions - labels
+            result[:-2] = data.T @ error
+            result[-2] = error.sum()
+            result[-1] = 0
+            if signal == b"c":
+                result[-1] = np.log1p(exp_neg).sum() + np.maximum(linear_model, 0).sum() - np.dot(labels, linear_model)
+            connection.send_bytes(b"d")
+    finally:
+        del params, result, data, labels, values, shards
+        for memory in handles:
+            memory.close()
+        connection.close()
+
+
+def _worker_neighbours(start, stop, batch_size, max_memory, k):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    process pool task: k nearest neighbours of the shared query rows [start, stop)
+    ===================================================================================
+    '''
+    return _WORKER_STATE["model"].kNeighbours(_WORKER_STATE["queries"][start:stop], batch_size, max_memory, k)
+
+
+def _matrix_bundle(values, labels):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    _Bundle of a training matrix and its labels for _share. A sparse CSR matrix is 
+    split into its three arrays so each goes to shared memory; _bundle_matrix rebuilds
+    it inside the worker without a copy
+    ===================================================================================
+    '''
+    if sparse.issparse(values):
+        return _Bundle(values=values.data, indices=values.indices, indptr=values.indptr, shape=values.shape, labels=labels)
+    return _Bundle(values=values, labels=labels)
+
+
+def _bundle_matrix(bundle):
+    if hasattr(bundle, "indptr"):
+        return sparse.csr_matrix((bundle.values, bundle.indices, bundle.indptr), shape=bundle.shape)
+    return bundle.values
+
+
+class _Bundle:
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    holder so loose arrays (query rows, fold data) go through _share/_attach like model
+    attributes
+    ===================================================================================
+    '''
+    def __init__(self, **arrays):
+        self.__dict__.update(arrays)
+
+
+_STORAGE_DTYPES = (np.dtype(np.float64), np.dtype(np.float32), np.dtype(np.uint8), np.dtype(np.int8))
+_REDUCTIONS = (None, "condensed", "edited", "hybrid")
+_METRICS = ("euclidean", "manhattan", "minkowski", "chebyshev", "cosine", "hamming")
+_MINKOWSKI_ORDERS = {"euclidean": 2, "manhattan": 1, "chebyshev": np.inf} #minkowski uses kNN.p
+_INDEXES = {"brute": None, "auto": None, "kdtree": _KDTree, "balltree": _BallTree, "ivf": _IVFIndex}
+_APPROXIMATE_INDEXES = {"ivf"} #indexes that may miss some true neighbours
+_FORMAT_VERSION = 1 #on-disk layout written by kNN.save and LogisticRegression.save, bumped on incompatible changes
+_SETTINGS = ("k", "dist_metric", "p", "index", "leaf_size", "n_lists", "n_probe", "random_state",
+             "batch_size", "max_memory", "n_jobs", "weights", "reduce", "cache_size") #kNN constructor arguments kept by save
+_TREE_MIN_ROWS = 100000 #below this many training rows index="auto" keeps the brute force scan
+_KDTREE_MAX_FEATURES = 6 #index="auto" builds a kd tree up to this many features and scans every row above it
+
+
+class kNN:
+    def __init__(self, k, dist_metric="euclidean", p=2, index="brute", leaf_size=40, n_lists=None, n_probe=4, random_state=None, batch_size=None, max_memory=None, n_jobs=1, weights="uniform", dtype="float64", reduce=None, cache_size=0, scaler=None):     
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        initialize kNN model
+        ===================================================================================
+        PARAMETERS:
+        ===================================================================================
+        * self (kNN): 
+        ----------------------------------------
+        kNN model to define k values, training data, and distance metric
+        ----------------------------------------
+        * k (int):
+        ----------------------------------------
+        integer representing number of neighbours to compare to
+        ----------------------------------------
+        * dist_metric (string):
+        ----------------------------------------
+        string representing distance metric formula to follow: "euclidean", "manhattan",
+        "minkowski", "chebyshev", "cosine", or "hamming" (number of differing features, 
+        for categorical data such as mushroom)
+        ----------------------------------------
+        * p (float):
+        ----------------------------------------
+        order of the "minkowski" distance, at least 1
+        ----------------------------------------
+        * index (string):
+        ----------------------------------------
+        neighbour search built by fit: "brute" (scan every row), "kdtree", "balltree", 
+        "auto" (a kd tree for large data with at most _KDTREE_MAX_FEATURES features, 
+        otherwise brute; the ball tree is only built when asked for), or "ivf" for an 
+        approximate search (see measureRecall)
+        ----------------------------------------
+        * leaf_size (int):
+        ----------------------------------------
+        maximum number of rows in a tree leaf, scanned directly during a query
+        ----------------------------------------
+        * n_lists, n_probe (int):
+        ----------------------------------------
+        index="ivf" only: number of k-means cells (default sqrt of the training size) and
+        number of nearest cells scanned per query
+        ----------------------------------------
+        * random_state (int):
+        ----------------------------------------
+        seed for the k-means initialisation of index="ivf"
+        ----------------------------------------
+        * batch_size (int), max_memory (int):
+        ----------------------------------------
+        default tiling of brute force predictions: query rows per tile (_QUERY_BLOCK if 
+        None) and a byte budget for the distance tiles (unbounded if None), see predict
+        ----------------------------------------
+        * n_jobs (int):
+        ----------------------------------------
+        worker processes sharing the neighbour search of predict, -1 for one per CPU
+        ----------------------------------------
+        * weights (string):
+        ----------------------------------------
+        "uniform" (one vote per neighbour) or "distance" (votes weighted by 1/distance)
+        ----------------------------------------
+        * dtype (string):
+        ----------------------------------------
+        storage of train data: "float64", "float32" (half the memory), or "uint8"/"int8"
+        (an eighth). 8 bit storage quantizes every column with its own offset and one 
+        shared step, so distances only change scale; integer data whose columns span at 
+        most 255 values (e.g. mushroom alphabet indices) is stored exactly
+        ----------------------------------------
+        * reduce (string):
+        ----------------------------------------
+        prototype reduction run by fit: "edited" (Wilson, drop rows their own k nearest 
+        neighbours misclassify), "condensed" (Hart, keep only rows the k-NN vote of the
+        kept rows gets wrong), "hybrid" (edited then condensed), or None to keep every row
+        ----------------------------------------
+        * cache_size (int):
+        ----------------------------------------
+        number of distinct query rows whose neighbours kNeighbours keeps (least recently
+        used first out), 0 to disable. Cleared whenever the training data or k changes
+        ----------------------------------------
+        * scaler (Scaler or string):
+        ----------------------------------------
+        feature scaling step, or the method name ("standard", "minmax", "robust") of a 
+        new one. fit refits it on the training rows (before any reduction or 8 bit 
+        quantization) and every later row is scaled with those statistics, so no column 
+        dominates the distance by its units alone. None leaves the rows as they are
+        ===================================================================================
+        '''
+        if dist_metric not in _METRICS:
+            raise ValueError(f"dist_metric must be one of {_METRICS}, got {dist_metric!r}")
+        if dist_metric == "minkowski" and p < 1:
+            raise ValueError(f"minkowski distance needs p >= 1, got {p}")
+        if index not in _INDEXES:
+            raise ValueError(f"index must be one of {sorted(_INDEXES)}, got {index!r}")
+        if weights not in ("uniform", "distance"):
+            raise ValueError(f"weights must be 'uniform' or 'distance', got {weights!r}")
+        if np.dtype(dtype) not in _STORAGE_DTYPES:
+            raise ValueError(f"dtype must be one of {[str(d) for d in _STORAGE_DTYPES]}, got {dtype!r}")
+        if reduce not in _REDUCTIONS:
+            raise ValueError(f"reduce must be one of {_REDUCTIONS}, got {reduce!r}")
+        self.k = k #num of neighbours
+        self.dist_metric = dist_metric #equation to calculate distance with
+        self.p = p
+        self.index = index #neighbour search structure to build in fit
+        self.leaf_size = leaf_size
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+        self.batch_size = batch_size
+        self.max_memory = max_memory
+        self.n_jobs = n_jobs
+        self.weights = weights
+        self.dtype = np.dtype(dtype)
+        self.reduce = reduce
+        self.compression_ratio = 1.0 #training rows passed to fit per row kept by reduce
+        self.cache_size = cache_size
+        self.cache = OrderedDict() #(row bytes, k, metric) -> (distances, indices), oldest first
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.quant_offset = None #8 bit storage: stored = round((x - quant_offset) / quant_scale) + quant_zero
+        self.quant_scale = 1.0
+        self.quant_zero = 0
+        self.train_data = None #initialize using fit method
+        self.train_labels = None
+        self.classes = None #sorted distinct labels, train_codes[i] is the position of train_labels[i]
+        self.train_codes = None
+        self.train_sqnorms = None
+        self.train_bits = None #hamming only: one-hot encoded train_data packed into uint64 words
+        self.train_ids = None #stable id of every row, used by remove
+        self.train_alive = None #False for rows removed but not yet compacted away
+        self.train_store = None #growable buffers behind the train_* arrays above
+        self.hamming_vocab = None
+        self.n_removed = 0
+        self.next_id = 0
+        self.tree = None #spatial index over train_data, None for brute force search
+        self.scaler = _as_scaler(scaler, np.float32 if self.dtype == np.float32 else np.float64)
+        self.source = None #how the training rows were read, see save
+        
+    def fit(self, data, labels):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        set train_data and train_labelsby loading in Train data used to compare new data
+        ===================================================================================
+        PARAMETERS:
+        ===================================================================================
+        * data[] (NumPy Array): 
+        ----------------------------------------
+        list of data with labels seperated
+        ----------------------------------------
+        * labels (NumPy Array):
+        ----------------------------------------
+        list of labels with data removed
+        ===================================================================================
+        '''
+        data = np.asarray(data, dtype=float)
+        labels = np.asarray(labels)
+        if self.scaler is not None:
+            data = self.scaler.fit_transform(data)
+        ids = np.arange(len(data))
+        self.next_id = len(data)
+        if self.reduce is not None:
+            ids = self.__prototypes(data, labels)#rows keep their position in data as id
+            self.compression_ratio = len(data) / len(ids)
+            data, labels = data[ids], labels[ids]
+        if self.dtype.kind in "iu":
+            self.__fitQuantizer(data)
+        self.__store(self.__encode(data, storage=True), labels, ids)
+
+    def __prototypes(self, data, labels):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function used in self.fit() when reduce is set. Return the sorted 
+        positions of the rows to keep. Both stages search with a scratch brute force 
+        model of the same metric: edited votes every row from its k nearest other rows 
+        in one self-join (as leaveOneOut), condensed grows a store from one row per class,
+        adding every row its k-NN vote misclassifies, until a full pass adds nothing (a 
+        1-NN store, as in Hart's rule, loses accuracy once k > 1 votes on so few rows).
+        Rows are checked in chunks as large as the store so early passes stay close to 
+        Hart's one-row-at-a-time rule
+        ===================================================================================
+        '''
+        keep = np.arange(len(data))
+        if self.reduce in ("edited", "hybrid"):
+            scratch = kNN(self.k, self.dist_metric, self.p)
+            scratch.fit(data, labels)
+            k_distances, k_indices = scratch.__selfNeighbours(data, self.k)
+            keep = keep[scratch.__vote(k_distances, k_indices) == scratch.train_codes]
+        if self.reduce in ("condensed", "hybrid") and len(keep):
+            data, labels = data[keep], labels[keep]
+            absorbed = np.zeros(len(data), dtype=bool)
+            absorbed[np.unique(labels, return_index=True)[1]] = True#seed: first row of every class
+            store = kNN(self.k, self.dist_metric, self.p)
+            store.fit(data[absorbed], labels[absorbed])
+            added = True
+            while added:
+                added = False
+                pending = np.flatnonzero(~absorbed)
+                start = 0
+                while start < len(pending):
+                    chunk = pending[start:start + len(store.train_data)]
+                    wrong = chunk[store.predict(data[chunk]) != labels[chunk]]
+                    if len(wrong):
+                        store.partial_fit(data[wrong], labels[wrong])
+                        absorbed[wrong] = added = True
+                    start += len(chunk)
+            keep = keep[absorbed]
+        return keep
+
+    def __fitQuantizer(self, data):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function used in self.fit() for 8 bit storage. Every column is shifted by
+        its minimum and all columns share one step, so a distance between stored rows is 
+        the true distance divided by quant_scale (minkowski metrics are rescaled in 
+        __kNearest). Integer data that already fits uses a step of 1, i.e. no rounding
+        ===================================================================================
+        '''
+        limits = np.iinfo(self.dtype)
+        levels = int(limits.max) - int(limits.min)
+        self.quant_offset = data.min(axis=0)
+        span = (data.max(axis=0) - self.quant_offset).max()
+        if np.array_equal(data, np.round(data)) and span <= levels:
+            self.quant_scale = 1.0
+        else:
+            self.quant_scale = span / levels if span > 0 else 1.0
+        self.quant_zero = int(limits.min)
+
+    def __encode(self, data, storage=False):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function converting float rows to the storage form of train_data. Query 
+        rows (storage=False) stay float in the quantized coordinates; stored rows are 
+        clipped to the 8 bit range (rows added later by partial_fit saturate at the 
+        range seen in fit)
+        ===================================================================================
+        '''
+        if self.dtype.kind not in "iu":
+            return np.asarray(data, dtype=self.dtype)
+        encoded = np.round((np.asarray(data, dtype=float) - self.quant_offset) / self.quant_scale) + self.quant_zero
+        if not storage:
+            return encoded
+        limits = np.iinfo(self.dtype)
+        return np.clip(encoded, limits.min, limits.max).astype(self.dtype)
+
+    def __decode(self, data):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function mapping 8 bit coordinates back to float data (cosine distance, 
+        which the column offsets do not cancel out of)
+        ===================================================================================
+        '''
+        return (np.asarray(data, dtype=float) - self.quant_zero) * self.quant_scale + self.quant_offset
+
+    def __distanceScale(self):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function returning the factor from stored coordinates back to true 
+        distances: quant_scale for minkowski metrics on 8 bit storage, otherwise 1
+        ===================================================================================
+        '''
+        if self.dtype.kind in "iu" and self.__minkowskiOrder() is not None:
+            return self.quant_scale
+        return 1.0
+
+    def __store(self, data, labels, ids):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function used by fit and compact. Load training rows into growable 
+        buffers, derive everything the searches need (label codes, cached norms, packed 
+        hamming words) and build the index
+        ===================================================================================
+        '''
+        self.clearCache()
+        self.classes, codes = np.unique(labels, return_inverse=True)#votes run on small integer codes
+        self.train_store = {
+            "data": _Growable(data),
+            "labels": _Growable(labels),
+            "codes": _Growable(codes),
+            "sqnorms": _Growable(self.__squaredNorms(data)),#reused by every euclidean/cosine query block
+            "ids": _Growable(ids),
+            "alive": _Growable(np.ones(len(data), dtype=bool)),
+        }
+        if self.dist_metric == "hamming":
+            self.hamming_vocab = [np.unique(column) for column in data.T]
+            self.train_store["bits"] = _Growable(self.__packCategories(data).T.copy(), axis=1)#one contiguous row per word
+        self.n_removed = 0
+        self.__refreshViews()
+        self.tree = self.__buildIndex()
+
+    def __squaredNorms(self, data):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function returning the squared norm of every stored row, in the 
+        coordinates the euclidean kernel uses (the decoded rows for cosine)
+        ===================================================================================
+        '''
+        if self.dist_metric == "cosine" and self.dtype.kind in "iu":
+            data = self.__decode(data)
+        return np.einsum("ij,ij->i", data, data, dtype=np.float64)
+
+    def __scaled(self, data):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function scaling query or new training rows with the statistics fit 
+        gathered (a scaled copy; the rows unchanged without a scaler)
+        ===================================================================================
+        '''
+        return data if self.scaler is None else self.scaler.transform(data)
+
+    def __refreshViews(self):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function pointing the train_* arrays at the filled part of their buffers
+        ===================================================================================
+        '''
+        for name, store in self.train_store.items():
+            setattr(self, "train_" + name, store.view)
+
+    def partial_fit(self, data, labels):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        add labelled rows to the training data without refitting. Rows are appended to 
+        growable buffers; an index built by fit keeps serving the old rows while the new 
+        ones are scanned directly, and is rebuilt once they pass _REBUILD_FRACTION of it
+        ===================================================================================
+        PARAMETERS:
+        ===================================================================================
+        * data (NumPy Array):
+        ----------------------------------------
+        new rows, labels seperated
+        ----------------------------------------
+        * labels (NumPy Array):
+        ----------------------------------------
+        label of every new row, new classes are allowed
+        ===================================================================================
+        RETURNS:
+        ===================================================================================
+        * ids (NumPy Array):
+        ----------------------------------------
+        id of every new row, to pass to remove later
+        ===================================================================================
+        '''
+        data = np.asarray(data, dtype=float)
+        labels = np.asarray(labels)
+        if self.train_data is None:
+            self.fit(data, labels)
+            return self.train_ids.copy()
+        self.clearCache()
+        data = self.__encode(self.__scaled(data), storage=True)#statistics of fit, not refitted
+        ids = np.arange(self.next_id, self.next_id + len(data))
+        self.next_id += len(data)
+        classes = np.union1d(self.classes, labels)
+        if len(classes) > len(self.classes):#renumber codes so classes stays sorted
+            codes = self.train_store["codes"]
+            codes.buffer[:codes.size] = np.searchsorted(classes, self.classes)[codes.view]
+            self.classes = classes
+        for name, rows in (("data", data), ("labels", labels), ("codes", np.searchsorted(self.classes, labels)),
+                           ("sqnorms", self.__squaredNorms(data)), ("ids", ids),
+                           ("alive", np.ones(len(data), dtype=bool))):
+            self.train_store[name].append(rows)
+        if self.dist_metric == "hamming":
+            vocab = [np.union1d(values, column) for values, column in zip(self.hamming_vocab, data.T)]
+            if any(len(new) > len(old) for new, old in zip(vocab, self.hamming_vocab)):
+                #unseen categories change the bit layout, so every row is packed again
+                self.hamming_vocab = vocab
+                self.train_store["bits"] = _Growable(self.__packCategories(self.train_store["data"].view).T.copy(), axis=1)
+            else:
+                self.train_store["bits"].append(self.__packCategories(data).T)
+        self.__refreshViews()
+        if self.tree is not None and len(self.train_data) - len(self.tree.order) > _REBUILD_FRACTION * len(self.tree.order):
+            self.tree = self.__buildIndex()
+        return ids
+
+    def remove(self, ids):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        retract training rows by id. Rows are only flagged as removed (searches skip 
+        them); once more than _COMPACT_FRACTION of the rows are flagged the buffers are 
+        compacted and the index rebuilt
+        ===================================================================================
+        PARAMETERS:
+        ===================================================================================
+        * ids (NumPy Array):
+        ----------------------------------------
+        ids returned by partial_fit (fit numbers its rows 0 to n-1)
+        ===================================================================================
+        '''
+        ids = np.atleast_1d(np.asarray(ids, dtype=self.train_ids.dtype))
+        positions = np.minimum(np.searchsorted(self.train_ids, ids), len(self.train_ids) - 1)#ids only ever increase along the rows
+        unknown = self.train_ids[positions] != ids
+        if unknown.any():
+            raise ValueError(f"unknown training ids: {ids[unknown][:10]}")
+        self.clearCache()
+        self.train_alive[positions] = False
+        self.n_removed = len(self.train_alive) - np.count_nonzero(self.train_alive)
+        if self.n_removed > _COMPACT_FRACTION * len(self.train_alive):
+            self.compact()
+
+    def compact(self):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        drop the rows flagged by remove from every buffer and rebuild the index. Ids are 
+        kept, row positions (the indices returned by kNeighbours) change
+        ===================================================================================
+        '''
+        if self.n_removed:
+            keep = self.train_alive
+            self.__store(self.train_data[keep], self.train_labels[keep], self.train_ids[keep])
 
+    def __minkowskiOrder(self):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function returning the order p when dist_metric is a minkowski distance 
+        (the metrics the tree and ivf indexes can search), otherwise None
+        ===================================================================================
+        '''
+        if self.dist_metric == "minkowski":
+            return self.p
+        return _MINKOWSKI_ORDERS.get(self.dist_metric)
 
-class kNN:
-    def __init__(self, k, dist_metric="euclidean"):     
+    def __packCategories(self, data):
         '''
         ===================================================================================
         DESCRIPTION: 
         ===================================================================================
-        initialize kNN model
+        private function used for dist_metric="hamming". One-hot encode every column 
+        against the values seen in fit (plus one spare bit per column for unseen values)
+        and pack the bits into uint64 words. Two rows then differ in one feature for 
+        every two bits set in their XOR, so a distance is a popcount
         ===================================================================================
         PARAMETERS:
         ===================================================================================
-        * self (kNN): 
+        * data (NumPy Array):
         ----------------------------------------
-        kNN model to define k values, training data, and distance metric
+        rows of categorical codes (e.g. mushroom alphabet indices)
+        ===================================================================================
+        RETURNS:
+        ===================================================================================
+        * words (NumPy Array):
         ----------------------------------------
-        * k (int):
+        (len(data), words per row) array of uint64
+        ===================================================================================
+        '''
+        widths = [len(values) + 1 for values in self.hamming_vocab]
+        offsets = np.concatenate(([0], np.cumsum(widths)))
+        bits = np.zeros((len(data), offsets[-1]), dtype=bool)
+        rows = np.arange(len(data))
+        for column, values in enumerate(self.hamming_vocab):
+            codes = np.minimum(np.searchsorted(values, data[:, column]), len(values) - 1)
+            codes[values[codes] != data[:, column]] = len(values)#unseen value: the spare bit
+            bits[rows, offsets[column] + codes] = True
+        packed = np.packbits(bits, axis=1, bitorder="little")
+        packed = np.pad(packed, ((0, 0), (0, -packed.shape[1] % 8)))#whole uint64 words
+        return packed.view(np.uint64)
+
+    def __buildIndex(self):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function used in self.fit(). Build the spatial index chosen by self.index
+        over train_data, or return None when queries should scan every row
+        ===================================================================================
+        '''
+        index = self.index
+        if index == "auto":
+            rows, features = self.train_data.shape
+            if self.__minkowskiOrder() is None or rows < _TREE_MIN_ROWS or features > _KDTREE_MAX_FEATURES:
+                index = "brute" #a blocked scan is quicker than walking a tree here, the ball tree too
+            else:
+                index = "kdtree"
+        if index == "brute":
+            return None
+        p = self.__minkowskiOrder()
+        if p is None:
+            raise ValueError(f"{index} index does not support dist_metric {self.dist_metric!r}")
+        if index == "ivf":
+            return _IVFIndex(self.train_data, self.n_lists, self.n_probe, self.random_state, p)
+        return _INDEXES[index](self.train_data, self.leaf_size, p)
+
+    def save(self, path, source=None):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        write the fitted model to a directory: one .npy file per training array (rows,
+        label codes, cached norms, ids, removed flags, packed hamming words), the label
+        vocabulary, the arrays of the built index and of the scaler, and a meta.json with 
+        the settings and the format version. kNN.load maps it back without refitting
+        ===================================================================================
+        PARAMETERS:
+        ===================================================================================
+        * path (string):
         ----------------------------------------
-        integer representing number of neighbours to compare to
+        directory to write, created if missing (existing model files are overwritten)
         ----------------------------------------
-        * dist_metric (string):
+        * source (dict):
         ----------------------------------------
-        string representing distance metric formula to follow
+        how the training rows were read, e.g. {"dataset": "adult", "reader": "readFileKNN"}
+        as Models.main writes it, so Server.py bench can build rows with the same columns
+        (self.source when None, kept by load)
         ===================================================================================
         '''
-        self.k = k #num of neighbours
-        self.dist_metric = dist_metric #equation to calculate distance with
-        self.train_data = None #initialize using fit method
-        self.train_labels = None
-        
-    def fit(self, data, labels):
+        if self.train_data is None:
+            raise ValueError("fit the model before saving it")
+        os.makedirs(path, exist_ok=True)
+        arrays = {"train_" + name: store.view for name, store in self.train_store.items() if name != "labels"}
+        arrays["classes"] = self.classes
+        if self.quant_offset is not None:
+            arrays["quant_offset"] = self.quant_offset
+        meta = {
+            "format_version": _FORMAT_VERSION,
+            "model": type(self).__name__,
+            "settings": {name: getattr(self, name) for name in _SETTINGS},
+            "dtype": self.dtype.str,
+            "quant_scale": float(self.quant_scale),
+            "quant_zero": int(self.quant_zero),
+            "n_removed": int(self.n_removed),
+            "next_id": int(self.next_id),
+            "hamming_vocab": None if self.hamming_vocab is None else [values.tolist() for values in self.hamming_vocab],
+            "tree": None,
+            "scaler": _save_scaler(self.scaler, path),
+            "source": source or self.source,
+        }
+        if self.tree is not None:
+            tree_arrays, tree_settings = self.tree._state()
+            arrays.update(("tree_" + name, array) for name, array in tree_arrays.items())
+            meta["tree"] = {"type": type(self.tree).__name__, "settings": tree_settings, "arrays": sorted(tree_arrays)}
+        for name, array in arrays.items():
+            if array.dtype.hasobject:#e.g. labels read as python strings
+                array = np.asarray(array.tolist())
+            np.save(os.path.join(path, name + ".npy"), array, allow_pickle=False)
+        with open(os.path.join(path, "meta.json"), "w") as file:
+            json.dump(meta, file, indent=1, default=lambda value: value.item())#numpy scalars
+
+    @classmethod
+    def load(cls, path, mmap=True):
         '''
         ===================================================================================
         DESCRIPTION: 
         ===================================================================================
-        set train_data and train_labelsby loading in Train data used to compare new data
+        read a model written by save. With mmap the arrays are copy-on-write memory maps 
+        of the files: nothing is read until a query touches it, and every process that 
+        loads the same directory shares one copy in the page cache
         ===================================================================================
         PARAMETERS:
         ===================================================================================
-        * data[] (NumPy Array): 
+        * path (string):
         ----------------------------------------
-        list of data with labels seperated
+        directory written by save
         ----------------------------------------
-        * labels (NumPy Array):
+        * mmap (bool):
         ----------------------------------------
-        list of labels with data removed
+        map the arrays (default) instead of reading them into memory
+        ===================================================================================
+        RETURNS:
+        ===================================================================================
+        * model (kNN):
+        ----------------------------------------
+        fitted model, ready for predict, partial_fit and remove
         ===================================================================================
         '''
-        self.train_data = data
-        self.train_labels = labels
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+        if meta.get("format_version") != _FORMAT_VERSION or meta.get("model", cls.__name__) != cls.__name__:
+            raise ValueError(f"{path} holds {meta.get('model', 'kNN')} format {meta.get('format_version')}, this version reads kNN format {_FORMAT_VERSION}")
+        def read(name):
+            return np.load(os.path.join(path, name + ".npy"), mmap_mode="c" if mmap else None)
+        model = cls(dtype=meta["dtype"], **meta["settings"])
+        model.classes = read("classes")
+        if os.path.exists(os.path.join(path, "quant_offset.npy")):
+            model.quant_offset = read("quant_offset")
+        model.quant_scale, model.quant_zero = meta["quant_scale"], meta["quant_zero"]
+        model.train_store = {}
+        for name in ("data", "codes", "sqnorms", "ids", "alive", "bits"):
+            if name != "bits" or meta["hamming_vocab"] is not None:
+                model.train_store[name] = _Growable(read("train_" + name), axis=1 if name == "bits" else 0)
+        model.train_store["labels"] = _Growable(model.classes[model.train_store["codes"].view])
+        if meta["hamming_vocab"] is not None:
+            model.hamming_vocab = [np.asarray(values, dtype=model.train_store["data"].buffer.dtype) for values in meta["hamming_vocab"]]
+        model.n_removed, model.next_id = meta["n_removed"], meta["next_id"]
+        model.scaler = _load_scaler(path, meta.get("scaler"))
+        model.source = meta.get("source")
+        model.__refreshViews()
+        if meta["tree"] is not None:
+            index = {"_KDTree": _KDTree, "_BallTree": _BallTree, "_IVFIndex": _IVFIndex}[meta["tree"]["type"]]
+            arrays = {name: read("tree_" + name) for name in meta["tree"]["arrays"]}
+            model.tree = index._restore(arrays, meta["tree"]["settings"])
+        return model
 
-    def predict(self, new_data):
+    def predict(self, new_data, batch_size=None, max_memory=None):
         '''
         ===================================================================================
         DESCRIPTION: 
@@ -185,70 +2124,163 @@ class kNN:
         * new_data (NumPy Array):
         ----------------------------------------
         Array of new data to predict classifications for
+        ----------------------------------------
+        * batch_size (int), max_memory (int):
+        ----------------------------------------
+        override self.batch_size / self.max_memory for this call. With max_memory (bytes)
+        the brute force scan also splits train data into tiles and merges each tile's k
+        nearest into a running result, so peak memory stays near the budget
         ===================================================================================
         RETURNS:
         ===================================================================================
-        * predictions (List):
+        * predictions (NumPy Array):
         ----------------------------------------
-        list of labels for each item in new_data
+        array of labels for each item in new_data
         ===================================================================================
         '''
-        predictions = []#return array of predicted classifications, for each row in new_data
-        for new_row in new_data:
-            # calculate distances between new data and training data                   
-            k_neighbours = self.__neighbours(new_row) #determine the k nearest neighbours using preffered distance metric
-            classifications = []#for the given neighbors check their label
-            distances = [] #for tiebreak if need be
-            for result in k_neighbours:
-                #print(f"new = {new_row}: train = {result[2]}")
-                i = result[1]#results formatted [row, index of row], so take the index to find the associated label
-                dist = result[0]
-                classifications.append(self.train_labels[i])#add label at index i
-                distances.append(dist)
+        k_distances, k_indices = self.kNeighbours(new_data, batch_size, max_memory) #k nearest neighbours of every row, one tile at a time
+        return self.classes[self.__vote(k_distances, k_indices)]#labels are decoded only here
 
-            
-            #check for ties in classifications here
-            # thinking is use multimode to check for classification ties, to know then we need to check lowest distance 
-            classifications_mode = statistics.multimode(classifications)
-            #print(classifications_mode)
-            #print(distances)
-
-            if len(classifications_mode) > 1: #i.e we have a tie
-                #go over distances, and get the lowest average and append that to predictions
-                #print(classifications_mode)
-                #make an array of size len(classifications) to store distances
-                distances_mode = [0.0] * len(classifications_mode)
-                #print(distances_mode, len(distances_mode), len(classifications_mode))
-                #if label from classifications is in modes, add the distance to the appropriate index in the distances array
-                classification_index = 0
-                for classification in classifications:
-                    if classification in classifications_mode: #if the classification is part of the multimode
-                        #get the proper index for the distance array for that 
-                        distance_index = classifications_mode.index(classification)
-                        #print(distance_index)
-                        #print(distances_mode)
-                        distances_mode[distance_index] += distances[classification_index] #increase the correct distance by the distance of the classification
-
-                    classification_index += 1
-
-                #print(distances)
-                #print(distances_mode)
-                #choose the minimum distance label and append to predictions
-                min_distance = min(distances_mode)
-
-                min_distance_index = distances_mode.index(min_distance)
-                #print(min_distance_index)
-                min_classification = classifications_mode[min_distance_index]
-
-                #print("The label with the minimum distance to neighbors is:", min_classification, "with distance:", min_distance)
-
-                predictions.append(min_classification)
+    def kNeighbours(self, new_data, batch_size=None, max_memory=None, k=None):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        return the distances and training indices of the k nearest neighbours of every 
+        row of new data, nearest first. With n_jobs > 1 the rows are split into chunks 
+        searched by a process pool; train data (and any index) is placed in shared memory
+        once instead of being pickled to every worker, and chunks come back in order
+        ===================================================================================
+        PARAMETERS:
+        ===================================================================================
+        * new_data (NumPy Array):
+        ----------------------------------------
+        rows to find neighbours for
+        ----------------------------------------
+        * batch_size (int), max_memory (int):
+        ----------------------------------------
+        tiling settings, see predict (max_memory applies per worker)
+        ----------------------------------------
+        * k (int):
+        ----------------------------------------
+        number of neighbours to return, self.k when None
+        ===================================================================================
+        RETURNS:
+        ===================================================================================
+        * k_distances, k_indices (NumPy Arrays):
+        ----------------------------------------
+        two (len(new_data), k) arrays sorted by distance, then by training index
+        ===================================================================================
+        '''
+        new_data = self.__scaled(np.asarray(new_data, dtype=float))
+        if self.cache_size and len(new_data):
+            return self.__cachedNeighbours(new_data, batch_size, max_memory, k)
+        return self.__neighbours(new_data, batch_size, max_memory, k)
+
+    def __cachedNeighbours(self, new_data, batch_size, max_memory, k):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function used in self.kNeighbours() when cache_size is set. Duplicate 
+        rows of the batch are collapsed with np.unique, distinct rows found in the LRU 
+        cache are served from it, and only the rest are searched (and then cached)
+        ===================================================================================
+        '''
+        rows, inverse = np.unique(new_data, axis=0, return_inverse=True)
+        keys = [(row.tobytes(), k or self.k, self.dist_metric) for row in rows]
+        results = [self.cache.get(key) for key in keys]
+        missing = [r for r, result in enumerate(results) if result is None]
+        self.cache_misses += len(missing)
+        self.cache_hits += len(rows) - len(missing)
+        for key, result in zip(keys, results):
+            if result is not None:
+                self.cache.move_to_end(key)
+        if missing:
+            k_distances, k_indices = self.__neighbours(rows[missing], batch_size, max_memory, k)
+            for r, distances, indices in zip(missing, k_distances, k_indices):
+                results[r] = self.cache[keys[r]] = (distances.copy(), indices.copy())#rows, not views of the batch
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        inverse = inverse.reshape(-1)
+        return np.array([d for d, i in results])[inverse], np.array([i for d, i in results])[inverse]
+
+    def __neighbours(self, new_data, batch_size, max_memory, k):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function used in self.kNeighbours(): search in this process, or split the
+        rows over a process pool when n_jobs > 1
+        ===================================================================================
+        '''
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else (self.n_jobs or 1)
+        chunk = max(_MIN_JOB_ROWS, -(-len(new_data) // (4 * n_jobs)))#a few chunks per worker evens out the load
+        if n_jobs <= 1 or len(new_data) <= chunk:
+            return self.__kNearest(new_data, batch_size, max_memory, k)
+        blocks = []
+        try:
+            shell = _share(self, blocks)
+            shell.n_jobs = 1
+            shell.train_labels = shell.train_store = None #workers only search, labels are voted here
+            shell.cache, shell.cache_size = None, 0
+            shell.scaler = None #queries arrive scaled
+            if self.tree is not None:
+                shell.tree = _share(self.tree, blocks)
+            queries = _share(_Bundle(rows=new_data), blocks)
+            starts = range(0, len(new_data), chunk)
+            with ProcessPoolExecutor(n_jobs, initializer=_worker_init, initargs=(shell, queries)) as pool:
+                results = list(pool.map(_worker_neighbours, starts, [start + chunk for start in starts],
+                                        [batch_size] * len(starts), [max_memory] * len(starts), [k] * len(starts)))
+        finally:
+            for block in blocks:
+                block.close()
+        return np.vstack([d for d, i in results]), np.vstack([i for d, i in results])
+
+    def __vote(self, k_distances, k_indices):
+        '''
+        ===================================================================================
+        DESCRIPTION:
+        ===================================================================================
+        private function used in self.predict(). Vote between the k nearest neighbours of
+        every row at once: per row class scores and summed distances are two bincounts 
+        over (row, class code) pairs. The highest score wins and a tie goes to the class 
+        with the smallest summed distance, then to the tied class met first in the order 
+        the original search listed neighbours (farthest first, equal distances by index),
+        which is the mode statistics.multimode returned first
+        ===================================================================================
+        RETURNS:
+        ===================================================================================
+        * codes (NumPy Array):
+        ----------------------------------------
+        predicted class code of every row, an index into self.classes
+        ===================================================================================
+        '''
+        rows, n_classes = len(k_indices), len(self.classes)
+        if rows == 0:
+            return np.zeros(0, dtype=np.intp)
+        #columns in the original neighbour order, so sums and first places follow it
+        order = np.lexsort((k_indices, -k_distances))
+        k_distances, k_indices = np.take_along_axis(k_distances, order, 1), np.take_along_axis(k_indices, order, 1)
+        codes = self.train_codes[k_indices]
+        pairs = (codes + n_classes * np.arange(rows)[:, None]).ravel()
+        if self.weights == "distance":
+            with np.errstate(divide="ignore"):
+                votes = 1.0 / k_distances
+            exact = k_distances == 0 #an exact match outvotes everything else in its row
+            exact_rows = exact.any(axis=1)
+            votes[exact_rows] = exact[exact_rows]
+        else:
+            votes = np.ones_like(k_distances)
+        scores = np.bincount(pairs, weights=votes.ravel(), minlength=rows * n_classes).reshape(rows, n_classes)
+        summed = np.bincount(pairs, weights=k_distances.ravel(), minlength=rows * n_classes).reshape(rows, n_classes).astype(float)
+        summed[scores < scores.max(axis=1, keepdims=True)] = np.inf #only tied leaders compete on distance
+        first = np.full((rows, n_classes), codes.shape[1])#column where each class first appears
+        for column in range(codes.shape[1] - 1, -1, -1):
+            first[np.arange(rows), codes[:, column]] = column
+        first[summed > summed.min(axis=1, keepdims=True)] = codes.shape[1] + 1 #only leaders still tied on distance
+        return np.argmin(first, axis=1)
 
-            else:
-                predictions.append(str(max(classifications, key=classifications.count))) #from collections import Counter
-        
-        return predictions
-    
     def evaluate_acc(self,predictions, test_labels, display=True):
         '''
         ===================================================================================
@@ -258,12 +2290,7 @@ class kNN:
         ===================================================================================
         '''
         total = len(predictions)
-        hits = 0
-
-        for i in range(total):
-            if predictions[i] == test_labels[i]:
-                hits += 1
-#             print(f"guess:{predictions[i]}|answer:{test_labels[i]}")
+        hits = np.count_nonzero(np.asarray(predictions) == np.asarray(test_labels))
         percentage = round(100*hits/total,2)
         if display:
             print(f"Success Rate: %{percentage}")
@@ -279,14 +2306,63 @@ class kNN:
         ===================================================================================
         '''
         self.k = k
-    
-    def __calc_distance(self,newRow, trainRow):
+        self.clearCache()
+
+    def clearCache(self):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        drop every cached neighbour list (the hit/miss counters are kept). Called by fit,
+        partial_fit, remove and setK, so cached results never outlive the training data
+        ===================================================================================
+        '''
+        self.cache = OrderedDict()#a new dict: unfitted copies of the model share the old one
+
+    def measureRecall(self, new_data, display=True):
+        '''
+        ===================================================================================
+        DESCRIPTION:
+        ===================================================================================
+        Compare the neighbours found by the fitted index to an exact brute force search
+        and return the recall: the share of returned neighbours that are no farther than
+        the true k-th neighbour (so equally distant duplicates count as hits)
+        ===================================================================================
+        PARAMETERS:
+        ===================================================================================
+        * new_data (NumPy Array):
+        ----------------------------------------
+        rows to search for, e.g. the test rows of a fold
+        ----------------------------------------
+        * display (bool):
+        ----------------------------------------
+        print the recall
+        ===================================================================================
+        RETURNS:
+        ===================================================================================
+        * recall (float):
+        ----------------------------------------
+        value in [0, 1], 1.0 for the exact indexes
+        ===================================================================================
+        '''
+        new_data = np.asarray(new_data, dtype=float)
+        found, _ = self.kNeighbours(new_data)
+        exact, _ = self.__scan(self.__encode(self.__scaled(new_data)), found.shape[1])
+        exact *= self.__distanceScale()
+        #small slack so the brute force rounding of the same distance still counts as a hit
+        hits = found <= exact[:, -1:] * (1 + 1e-9) + 1e-12
+        recall = hits.mean()
+        if display:
+            print(f"Neighbour Recall: %{round(100*recall,2)}")
+        return recall
+
+    def __distances(self, queries, train_start=0, train_stop=None):
         '''
         ===================================================================================
         DESCRIPTION: 
         ===================================================================================
-        Private Function used in self.__neighbours(). Given a row from new data, calculate 
-        the distance based on a set metric from a row in Train data
+        Private Function used in self.__kNearest(). Given a block of rows from new data, 
+        calculate the distance based on a set metric from every row in Train data at once
         ===================================================================================
         PARAMETERS:
         ===================================================================================
@@ -294,36 +2370,69 @@ class kNN:
         ----------------------------------------
         kNN model with predefined k values, training data, and distance metric
         ----------------------------------------
-        * newRow[] (List of data points (float/int)):
+        * queries (NumPy Array):
         ----------------------------------------
-        data row to compare distance from train row data 
+        block of data rows to compare distance from train row data 
         ----------------------------------------
-        * trainRow[] (List of data points (float/int)):
+        * train_start, train_stop (int):
         ----------------------------------------
-        data row to compare distance with test data
+        slice of train data to compare against, all of it by default
         ===================================================================================
         RETURNS:
         ===================================================================================
-        * distance (float):
+        * distances (NumPy Array):
         ----------------------------------------
-        float distance between to rows of data
+        (len(queries), train rows in the slice) matrix of distances between the two sets
         ===================================================================================
         '''
-        distance = 0
+        train = slice(train_start, train_stop)
+        train_data = self.train_data[train]
+        if train_data.dtype.kind in "iu" and self.dist_metric in ("euclidean", "cosine"):
+            #no integer BLAS in NumPy: widen one tile at a time, exact for 8 bit codes
+            train_data = train_data.astype(np.float32) if self.dist_metric == "euclidean" else self.__decode(train_data)
+            queries = queries.astype(np.float32) if self.dist_metric == "euclidean" else self.__decode(queries)
         if self.dist_metric == "euclidean":
-            for i in range(len(newRow)):
-                squared = pow(newRow[i] - trainRow[i],2)
-                distance += squared
-            distance = sqrt(distance)
-        return(distance)
+            #||a - b||^2 = ||a||^2 + ||b||^2 - 2a.b, so the whole block is one matrix product
+            squared = np.einsum("ij,ij->i", queries, queries)[:, None] + self.train_sqnorms[None, train]
+            squared -= 2.0 * (queries @ train_data.T)
+            np.maximum(squared, 0.0, out=squared)#rounding can leave tiny negatives
+            return np.sqrt(squared, out=squared)
+        if self.dist_metric == "cosine":
+            #1 - a.b / (|a||b|), a row of zeros is treated as orthogonal to everything
+            norms = np.outer(np.sqrt(np.einsum("ij,ij->i", queries, queries)), np.sqrt(self.train_sqnorms[train]))
+            similarity = queries @ train_data.T
+            np.divide(similarity, norms, out=similarity, where=norms > 0)
+            similarity[norms == 0] = 0.0
+            return np.maximum(1.0 - similarity, 0.0)
+        distances = np.zeros((len(queries), len(train_data)))
+        if self.dist_metric == "hamming":
+            words = self.__packCategories(queries)
+            for w, train_word in enumerate(self.train_bits[:, train]):
+                distances += np.bitwise_count(words[:, w, None] ^ train_word[None, :])
+            return np.multiply(distances, 0.5, out=distances)#every differing feature flips two bits
+        #minkowski family: accumulate one feature at a time so only (queries, train) sized temporaries exist
+        p = self.__minkowskiOrder()
+        difference = np.empty_like(distances)
+        for j in range(queries.shape[1]):
+            np.subtract(queries[:, j, None], train_data[None, :, j], out=difference, dtype=difference.dtype)#no uint8 wrap-around
+            np.abs(difference, out=difference)
+            if p == np.inf:
+                np.maximum(distances, difference, out=distances)
+            elif p == 1:
+                distances += difference
+            else:
+                distances += np.power(difference, p, out=difference)
+        if p != 1 and p != np.inf:
+            np.power(distances, 1 / p, out=distances)
+        return distances
 
-    def __neighbours(self, new_row):
+    def __kNearest(self, new_data, batch_size=None, max_memory=None, k=None):
         '''
         ===================================================================================
         DESCRIPTION: 
         ===================================================================================
-        private function used in self.predict(). Given a row from new data, return k number
-        of neigbours based on distance
+        private function used in self.predict(). Given new data, return the distances and 
+        training indices of the k nearest neighbours of every row, nearest first
         ===================================================================================
         PARAMETERS:
         ===================================================================================
@@ -331,75 +2440,158 @@ class kNN:
         ----------------------------------------
         kNN model with predefined k values, training data, and distance metric
         ----------------------------------------
-        * newRow[] (List of data points (float/int)):
+        * new_data (NumPy Array):
+        ----------------------------------------
+        rows to find neighbours for, searched through self.tree when one was built or 
+        else scanned tile by tile (see self.__scan)
         ----------------------------------------
-        data row to compare distance from train row data 
+        * batch_size (int), max_memory (int):
         ----------------------------------------
-        * trainRow[] (List of data points (float/int)):
+        tiling settings, self.batch_size / self.max_memory when None
         ----------------------------------------
-        data row to compare distance with test data
+        * k (int):
+        ----------------------------------------
+        number of neighbours, self.k when None
         ===================================================================================
         RETURNS:
         ===================================================================================
-        * k_neighbours (List):
+        * k_distances, k_indices (NumPy Arrays):
         ----------------------------------------
-        list of k closest neighbours based on distance metric
+        two (len(new_data), k) arrays sorted by distance, then by training index
         ===================================================================================
         '''
-        distances = []#heap array
-        #for every row of data
-        for index in range(len(self.train_data)):#use index to return that value later
-            train_row = self.train_data[index]#current row of train data
-            dist = self.__calc_distance(new_row, train_row)#calculate distance between new row and train data row
-            heapq.heappush(distances, [-dist, index, list(train_row)])#make negative value temporarily to assure we have smallest values 
-            if len(distances) > self.k:#past k values remove largest from heap
-                heapq.heappop(distances)
-        
-        k_neighbours = [[-dist, index, train_row] for dist, index, train_row in sorted(distances)]#make positive values, only 5 smallest remain
+        k = min(k or self.k, len(self.train_data) - self.n_removed)
+        new_data = self.__encode(new_data)#same storage form as train_data
+        if self.tree is None:
+            k_distances, k_indices = self.__scan(new_data, k, batch_size, max_memory)
+        else:
+            k_distances, k_indices = self.tree.query(new_data, k, self.train_alive if self.n_removed else None)
+            indexed = len(self.tree.order)
+            if indexed < len(self.train_data):#rows added by partial_fit since the index was built
+                added_distances, added_indices = self.__scan(new_data, k, batch_size, max_memory, indexed)
+                k_distances, k_indices = _merge_k(k_distances, k_indices, added_distances, added_indices, k)
+        k_distances *= self.__distanceScale()
+        return k_distances, k_indices
+
+    def __tileShape(self, batch_size, max_memory):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function used in self.__scan(). Number of query rows and train rows per 
+        distance tile: batch_size query rows (default _QUERY_BLOCK) against every train 
+        row, unless max_memory bytes can not hold that many pairs, in which case the train
+        rows are tiled first and the query rows only shrink when train tiles would fall 
+        under _MIN_TRAIN_TILE rows
+        ===================================================================================
+        '''
+        batch_size = batch_size or self.batch_size or _QUERY_BLOCK
+        max_memory = max_memory or self.max_memory
+        train_rows = len(self.train_data)
+        if max_memory is None:
+            return batch_size, train_rows
+        pairs = max(1, max_memory // _BYTES_PER_PAIR)
+        train_tile = min(train_rows, max(1, pairs // batch_size))
+        if train_tile < min(train_rows, _MIN_TRAIN_TILE):
+            train_tile = min(train_rows, _MIN_TRAIN_TILE)
+            batch_size = max(1, pairs // train_tile)
+        return batch_size, train_tile
 
-        return k_neighbours
+    def __scan(self, new_data, k, batch_size=None, max_memory=None, train_from=0):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function used in self.__kNearest() and self.measureRecall(). Exact brute 
+        force search over tiles of (query rows, train rows). The k nearest of each train 
+        tile are merged into a running k nearest per query row, so only one tile of 
+        distances is held at a time. Only train rows from train_from on are searched, and
+        removed rows are never returned while enough live rows remain
+        ===================================================================================
+        '''
+        query_tile, train_tile = self.__tileShape(batch_size, max_memory)
+        k = min(k, len(self.train_data) - train_from)
+        k_distances = np.empty((len(new_data), k))
+        k_indices = np.empty((len(new_data), k), dtype=np.intp)
+        for start in range(0, len(new_data), query_tile):
+            queries = new_data[start:start + query_tile]
+            best_distances = best_indices = None
+            for train_start in range(train_from, len(self.train_data), train_tile):
+                distances = self.__distances(queries, train_start, train_start + train_tile)
+                if self.n_removed:
+                    distances[:, ~self.train_alive[train_start:train_start + train_tile]] = np.inf
+                tile_distances, tile_indices = _smallest_k(distances, k)
+                if best_distances is None:
+                    best_distances, best_indices = tile_distances, tile_indices + train_start
+                else:
+                    best_distances, best_indices = _merge_k(best_distances, best_indices, tile_distances, tile_indices + train_start, k)
+            k_distances[start:start + query_tile], k_indices[start:start + query_tile] = best_distances, best_indices
+        return k_distances, k_indices
     
-    def __foldSplit(self, data, k_folds):
+    def __foldIndices(self, labels, k_folds, shuffle=False, stratify=False, random_state=None):
         '''
         ===================================================================================
         DESCRIPTION: 
         ===================================================================================
-        split data into folds used for kFoldCross function 
+        split row positions into folds used for kFoldCross function. Folds are index 
+        arrays over one data matrix, so no per fold copies of the data set are made
         ===================================================================================
         PARAMETERS:
         ===================================================================================
-        * self (kNN): [not used]
-        ----------------------------------------
-        kNN model with predefined k values, training data, and distance metric
+        * labels (numpy array):
         ----------------------------------------
-        * data (numpy array):
-        ----------------------------------------
-        data to split into training and test data based on k value
+        label of every row, used when stratify is set
         ----------------------------------------
         * k_folds (int):
         ----------------------------------------
         number of folds to split data into       
+        ----------------------------------------
+        * shuffle (bool), random_state (int):
+        ----------------------------------------
+        shuffle rows before splitting, seeded by random_state. Without shuffling folds 
+        are consecutive rows and the last fold takes the remainder
+        ----------------------------------------
+        * stratify (bool):
+        ----------------------------------------
+        give every fold the same share of each label
+        ===================================================================================
+        RETURNS:
+        ===================================================================================
+        * folds (List):
+        ----------------------------------------
+        k_folds sorted arrays of test row positions
         ===================================================================================
         '''  
-        data_size = len(data)
-        fold_size = data_size//k_folds
-        data_split = []
-        
-        for i in range(k_folds):
-#             print(i)
-            start_i = i * fold_size
-            end_i = (i + 1) * fold_size if i < k_folds - 1 else len(data)
-
-            # Extract the test data for this fold
-            test_data = data[start_i:end_i]
-#             print(test_data)
-
-            # Extract the training data for this fold
-            train_data = np.concatenate([data[:start_i], data[end_i:]], axis=0)
-            data_split.append((train_data, test_data))        
-        return data_split
+        rng = np.random.default_rng(random_state)
+        order = rng.permutation(len(labels)) if shuffle else np.arange(len(labels))
+        if not stratify:
+            fold_size = len(labels)//k_folds
+            bounds = [i * fold_size for i in range(k_folds)] + [len(labels)]
+            return [np.sort(order[bounds[i]:bounds[i + 1]]) for i in range(k_folds)]
+        folds = [[] for _ in range(k_folds)]
+        _, codes = np.unique(labels[order], return_inverse=True)
+        for code in range(codes.max() + 1):
+            for i, part in enumerate(np.array_split(order[codes == code], k_folds)):
+                folds[i].append(part)
+        return [np.sort(np.concatenate(parts)) for parts in folds]
+
+    def __unfitted(self):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function returning a copy of the model settings without any training 
+        state, small enough to send to a worker process
+        ===================================================================================
+        '''
+        clone = copy.copy(self)
+        for name in vars(self):
+            if name.startswith("train_"):
+                setattr(clone, name, None)
+        clone.classes = clone.tree = clone.hamming_vocab = None
+        return clone
     
-    def kFoldCross(self, data, k_folds, display=True):
+    def kFoldCross(self, data, k_folds, display=True, shuffle=False, stratify=False, random_state=None, n_jobs=1):
         '''
         ===================================================================================
         DESCRIPTION: 
@@ -420,33 +2612,191 @@ class kNN:
         * k_folds (int):
         ----------------------------------------
         number of folds to split data into       
+        ----------------------------------------
+        * shuffle (bool), stratify (bool), random_state (int):
+        ----------------------------------------
+        how rows are assigned to folds, see __foldIndices
+        ----------------------------------------
+        * n_jobs (int):
+        ----------------------------------------
+        folds run concurrently in this many worker processes (-1 for one per CPU), the 
+        data matrix is placed in shared memory once
         ===================================================================================
         '''    
-        
-        dataSplit = self.__foldSplit(data,k_folds)
-        size = len(dataSplit)
+        values, labels = self.__seperateLabels(data)#converted to float once for every fold
+        folds = self.__foldIndices(labels, k_folds, shuffle, stratify, random_state)
+        n_jobs = os.cpu_count() if n_jobs == -1 else (n_jobs or 1)
+        if n_jobs > 1:
+            accuracies = self.__parallelFolds(values, labels, folds, n_jobs)
         accAvg = 0
         
-        for i in range(size):
+        for i, test in enumerate(folds):
             if display:
                 print("=================================")
                 print(f"Training with Fold {i+1}")
                 print("---------------------------------")
 
-            train_data_list,test_data_list = dataSplit[i]
-            train_data, train_labels = self.__seperateLabels(train_data_list)
-            test_data, test_labels = self.__seperateLabels(test_data_list)
-            
-            self.fit(train_data, train_labels)
-            predictions = self.predict(test_data)
-            accAvg += self.evaluate_acc(predictions, test_labels, display)
+            if n_jobs > 1:
+                accuracy = accuracies[i]
+                if display:
+                    print(f"Success Rate: %{accuracy}")
+            else:
+                train = np.ones(len(values), dtype=bool)
+                train[test] = False
+                self.fit(values[train], labels[train])
+                predictions = self.predict(values[test])
+                accuracy = self.evaluate_acc(predictions, labels[test], display)
+                if display and self.index in _APPROXIMATE_INDEXES:#show what the approximate search cost in neighbour quality
+                    self.measureRecall(values[test])
+                if display and self.reduce is not None:
+                    print(f"Prototypes: {len(self.train_data)} of {np.count_nonzero(train)} rows ({round(self.compression_ratio, 2)}x smaller)")
+            accAvg += accuracy
         accAvg/=k_folds
         if display:
             print(f"Average Accuracy: %{accAvg}")
         return accAvg
-            
 
-        
+    def __parallelFolds(self, values, labels, folds, n_jobs):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function used in self.kFoldCross(). Run every fold in a process pool, each
+        worker fitting its own copy of the unfitted model on the shared data matrix, and 
+        return the fold accuracies in fold order
+        ===================================================================================
+        '''
+        blocks = []
+        try:
+            model = self.__unfitted()
+            model.n_jobs = 1 #the folds already use the worker processes
+            shared = _share(_Bundle(values=values, labels=labels), blocks)
+            with ProcessPoolExecutor(min(n_jobs, len(folds)), initializer=_fold_worker_init, initargs=(model, shared)) as pool:
+                return list(pool.map(_worker_fold, folds))
+        finally:
+            for block in blocks:
+                block.close()
+
+    def kSweep(self, data, k_folds=5, kRange=10, display=False):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        k Fold cross validation of every k from 1 to kRange in one pass: each fold finds 
+        the kRange nearest neighbours of its test rows once, and every smaller k is voted
+        from the k nearest of those lists, picked with the same tie rule as a k search
+        ===================================================================================
+        PARAMETERS:
+        ===================================================================================
+        * data (numpy array):
+        ----------------------------------------
+        data to split into training and test data, labels in the last column
+        ----------------------------------------
+        * k_folds (int):
+        ----------------------------------------
+        number of folds to split data into
+        ----------------------------------------
+        * kRange (int):
+        ----------------------------------------
+        largest number of neighbours to score
+        ----------------------------------------
+        * display (bool):
+        ----------------------------------------
+        print the accuracy of every k
+        ===================================================================================
+        RETURNS:
+        ===================================================================================
+        * accuracy (List):
+        ----------------------------------------
+        average accuracy (percent) over the folds, accuracy[k-1] is the score of k
+        ===================================================================================
+        '''
+        accuracy = np.zeros(kRange)
+        values, labels = self.__seperateLabels(data)
+        for test in self.__foldIndices(labels, k_folds):
+            train = np.ones(len(values), dtype=bool)
+            train[test] = False
+            self.fit(values[train], labels[train])
+            k_distances, k_indices = self.kNeighbours(values[test], k=kRange)
+            for k in range(1, kRange + 1):
+                #not the first k columns: between equal distances at the k-th place a k search keeps the larger indices
+                predictions = self.classes[self.__vote(*_smallest_k(k_distances, k, k_indices))]
+                accuracy[k - 1] += self.evaluate_acc(predictions, labels[test], False)
+        accuracy /= k_folds
+        if display:
+            for k in range(1, kRange + 1):
+                print(f"k = {k}: Average Accuracy: %{round(accuracy[k - 1], 2)}")
+        return accuracy.tolist()
+
+    def leaveOneOut(self, data, display=True, kRange=None):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        leave one out cross validation without n refits: fit on every row once, find the
+        k+1 nearest neighbours of the training set itself in one blocked pass, and drop 
+        each row's own match so it is classified by the other n-1 rows only. The model 
+        is left fitted on all of data
+        ===================================================================================
+        PARAMETERS:
+        ===================================================================================
+        * data (numpy array):
+        ----------------------------------------
+        data to evaluate, labels in the last column
+        ----------------------------------------
+        * display (bool):
+        ----------------------------------------
+        print the accuracy (of every k with kRange)
+        ----------------------------------------
+        * kRange (int):
+        ----------------------------------------
+        score every k from 1 to kRange from the same neighbour lists, like kSweep. By 
+        default only self.k is scored
+        ===================================================================================
+        RETURNS:
+        ===================================================================================
+        * accuracy (float or List):
+        ----------------------------------------
+        accuracy (percent) of self.k, or with kRange a list of floats like kSweep, 
+        accuracy[k-1] for every k up to kRange
+        ===================================================================================
+        '''
+        values, labels = self.__seperateLabels(data)
+        if self.reduce is not None:
+            raise ValueError("leaveOneOut needs every row as its own match, use reduce=None")
+        self.fit(values, labels)
+        k_distances, k_indices = self.__selfNeighbours(values, kRange or self.k)
+        ks = range(1, kRange + 1) if kRange else [self.k]
+        accuracy = np.zeros(len(ks))
+        for i, k in enumerate(ks):
+            #reselect like kSweep so every k keeps the neighbours a k search would
+            predictions = self.classes[self.__vote(*_smallest_k(k_distances, k, k_indices))]
+            accuracy[i] = self.evaluate_acc(predictions, labels, False)
+            if display:
+                print(f"k = {k}: Leave One Out Accuracy: %{round(accuracy[i], 2)}")
+        return accuracy.tolist() if kRange else float(accuracy[0])#same list of floats as kSweep
+
+    def __selfNeighbours(self, values, k):
+        '''
+        ===================================================================================
+        DESCRIPTION: 
+        ===================================================================================
+        private function used by leaveOneOut and the edited reduction. The model must be 
+        fitted on exactly values; return the k nearest neighbours of every training row 
+        among the other rows, from one k+1 neighbour search of the set against itself
+        ===================================================================================
+        '''
+        k_distances, k_indices = self.kNeighbours(values, k=k + 1)
+        own = k_indices == np.arange(len(values))[:, None]
+        #a row tied at distance 0 with more than k higher indexed duplicates is not in its own 
+        #list; its k+1 neighbours are then all true LOO neighbours and the one the search would
+        #drop next goes: the smallest index at the largest distance
+        missing = np.flatnonzero(~own.any(axis=1))
+        worst = np.argmax(k_distances[missing] == k_distances[missing, -1:], axis=1)
+        own[missing, worst] = True
+        shape = (len(values), k_indices.shape[1] - 1)
+        return k_distances[~own].reshape(shape), k_indices[~own].reshape(shape)
+
     def __seperateLabels(self, data):
         '''
         ===================================================================================
@@ -514,6 +2864,22 @@ class kNN:
         
         return(dataSplit)
 
+def load_model(path, mmap=True):
+    '''
+    ===================================================================================
+    DESCRIPTION: 
+    ===================================================================================
+    load a directory written by kNN.save or LogisticRegression.save, whichever model it
+    holds (Server.py serves either)
+    ===================================================================================
+    '''
+    with open(os.path.join(path, "meta.json")) as file:
+        name = json.load(file).get("model", "kNN")
+    if name == "LogisticRegression":
+        return LogisticRegression.load(path)
+    return kNN.load(path, mmap)
+
+
 def main() -> None:
     """
     Train / evaluate LogisticRegression or kNN on one of the three datasets.
@@ -531,7 +2897,7 @@ def main() -> None:
     if script_dir not in sys.path:
         sys.path.insert(0, script_dir)
 
-    from Functions import readFile, readFileKNN
+    from Functions import readFile, readFileKNN, readFileOneHot, encodeFeatures
 
     # 1 ─ CLI arguments
     p = argparse.ArgumentParser(description="Run LR or kNN on a UCI dataset")
@@ -540,10 +2906,41 @@ def main() -> None:
               choices=["adult", "rice", "mushroom", "iris", "ionosphere"],
              default="adult")
     p.add_argument("--folds",   type=int,   default=5)
+    p.add_argument("--save",    default=None)               # directory, fit on all rows and save for Server.py
     p.add_argument("--lr",      type=float, default=0.01)   # LR only
     p.add_argument("--iters",   type=int,   default=1000)   # LR only
+    p.add_argument("--l2",      type=float, default=0.0)    # LR only, weight penalty
+    p.add_argument("--multi_class", choices=["binary", "multinomial"],
+                   default="binary",                        # LR only, multinomial keeps the file's labels
+                   help="multinomial needs --solver gd; --n_jobs then runs folds in parallel")
+    p.add_argument("--one_hot", action="store_true")        # LR only, sparse one-hot features
+    p.add_argument("--scaler",  choices=["standard", "minmax", "robust"],
+                   default=None)                            # feature scaling step, both models
+    p.add_argument("--solver",  choices=["gd", "sgd", "newton", "lbfgs"],
+                   default="gd")                            # LR only
+    p.add_argument("--batch_size", type=int, default=32)    # LR, solver=sgd only
+    p.add_argument("--epochs",  type=int,   default=10)     # LR, solver=sgd only
+    p.add_argument("--schedule", choices=["constant", "inverse", "exponential"],
+                   default="constant")                      # LR, solver=sgd only
     p.add_argument("--k",       type=int,   default=5)      # kNN only
+    p.add_argument("--n_jobs",  type=int,   default=1)      # worker processes, -1 = all CPUs
+    p.add_argument("--weights", choices=["uniform", "distance"],
+                   default="uniform")                       # kNN only
+    p.add_argument("--metric",  choices=["euclidean", "manhattan", "minkowski",
+                                         "chebyshev", "cosine", "hamming"],
+                   default="euclidean")                     # kNN only
+    p.add_argument("--p",       type=float, default=2)      # kNN, metric=minkowski only
+    p.add_argument("--index",   choices=["brute", "kdtree", "balltree", "auto", "ivf"],
+                   default="brute")                         # kNN only
+    p.add_argument("--n_lists", type=int,   default=None)   # kNN, index=ivf only
+    p.add_argument("--n_probe", type=int,   default=4)      # kNN, index=ivf only
+    p.add_argument("--reduce",  choices=["condensed", "edited", "hybrid"],
+                   default=None)                            # kNN prototype reduction
+    p.add_argument("--dtype",   choices=["float64", "float32", "uint8", "int8"],
+                   default="float64")                       # kNN train storage
     args = p.parse_args()
+    if args.model == "logistic" and args.multi_class == "multinomial" and args.solver != "gd":
+        p.error(f"--multi_class multinomial needs --solver gd, got {args.solver}")
 
     # 2 ─ locate the short file-name
     data_dir = os.path.abspath(os.path.join(script_dir, "..", "data"))
@@ -566,50 +2963,49 @@ def main() -> None:
 
     # 3 ─ load the data
     with cd(data_dir):
-        if args.model == "logistic":
-            X, y = readFile(base_name)                 # → numeric already
+        if args.model == "logistic" and args.one_hot:   # scipy.sparse CSR, every column
+            X, y, _ = readFileOneHot(base_name, binary=args.multi_class == "binary")
+            y = np.asarray(y, dtype=int if args.multi_class == "binary" else None)
+        elif args.model == "logistic":
+            X, y = readFile(base_name, binary=args.multi_class == "binary")  # → numeric already
             X = np.asarray(X, dtype=float)
-            y = np.asarray(y, dtype=int)
+            y = np.asarray(y, dtype=int if args.multi_class == "binary" else None)
         else:                                          # kNN path
             combined = readFileKNN(base_name)          # may contain strings
 
     # 4 ─ if we are in the kNN branch, encode features to numbers
     if args.model == "knn":
-
-        def encode_features(mat: np.ndarray) -> np.ndarray:
-            """
-            Replace every non-numeric column in `mat` (all rows, except
-            the last column = label) with 0,1,2,… ordinal tokens.
-            Labels stay untouched.
-            Returns an object-dtype array suitable for __seperateLabels().
-            """
-            mat = mat.astype(object)                   # keep heterogeneity
-            n_cols = mat.shape[1] - 1                  # skip label col
-
-            for col in range(n_cols):
-                try:
-                    mat[:, col].astype(float)          # already numeric?
-                except ValueError:
-                    uniq, inv = np.unique(mat[:, col], return_inverse=True)
-                    mat[:, col] = inv                  # 0…N encoding
-            return mat
-
-        combined = encode_features(combined)
+        combined = encodeFeatures(combined)
+    # the same reader rebuilds these columns for Server.py bench
+    reader = "readFileKNN" if args.model == "knn" else "readFileOneHot" if args.one_hot else "readFile"
+    source = {"dataset": args.dataset, "reader": reader, "binary": args.multi_class == "binary"}
 
     # 5 ─ run the chosen model
     if args.model == "logistic":
-        lr_model = LogisticRegression()
+        lr_model = LogisticRegression(solver=args.solver, batch_size=args.batch_size,
+                                      epochs=args.epochs, schedule=args.schedule, l2=args.l2,
+                                      multi_class=args.multi_class, scaler=args.scaler)
         lr_model.set_learning_rate(args.lr)
         lr_model.num_iterations = args.iters
 
-        accs, iters = lr_model.k_fold(X, y, args.folds)
+        accs, iters = lr_model.k_fold(X, y, args.folds, n_jobs=args.n_jobs)
         print("Fold accuracies:", np.round(accs, 4))
         print("Avg accuracy   :", round(np.mean(accs), 4))
         print("Iterations/fit :", iters)
+        if lr_model.grad_norm is not None:             # folds fitted in this process
+            print("Final |grad|   :", lr_model.grad_norm)
+        if args.save:
+            lr_model.fit(X, y)
+            lr_model.save(args.save, source)
     else:
-        knn_model = kNN(k=args.k)
+        knn_model = kNN(k=args.k, dist_metric=args.metric, p=args.p, index=args.index, n_jobs=args.n_jobs,
+                        weights=args.weights, dtype=args.dtype, reduce=args.reduce, scaler=args.scaler,
+                        n_lists=args.n_lists, n_probe=args.n_probe)
         avg_acc   = knn_model.kFoldCross(combined, args.folds, display=True)
         print("Avg accuracy   :", round(avg_acc, 4))
+        if args.save:
+            knn_model.fit(combined[:, :-1].astype(float), combined[:, -1])
+            knn_model.save(args.save, source)
 
 
 if __name__ == "__main__":
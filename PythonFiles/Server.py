@@ -0,0 +1,460 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+# Make Models.py / Functions.py visible when run as a script
+script_dir = os.path.dirname(os.path.abspath(__file__))      # …/PythonFiles
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+from Models import LogisticRegression, load_model
+
+
+_MAX_BODY = 64 * 1024 * 1024 #largest request body accepted, in bytes
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+_FILE_MAP = {
+    "adult":      "adult.data",
+    "rice":       "Rice_Cammeo_Osmancik.arff.txt",
+    "mushroom":   "agaricus-lepiota.data",
+    "iris":       "iris.data",
+    "ionosphere": "ionosphere.data",
+}
+
+
+def _num_features(model):
+    #columns every scored row must have
+    if isinstance(model, LogisticRegression):
+        return np.shape(model.weights)[0]
+    return model.train_data.shape[1]
+
+
+def bench_rows(source, dataset=None):
+    '''
+    ===================================================================================
+    DESCRIPTION:
+    ===================================================================================
+    feature rows of a dataset built the way the served model's training rows were
+    (source as saved by Models.main: readFile, readFileOneHot, or readFileKNN followed
+    by encodeFeatures), so bench sends the columns the model expects. Without a source
+    the dataset is read with readFile
+    ===================================================================================
+    '''
+    from Functions import readFile, readFileKNN, readFileOneHot, encodeFeatures
+    source = source or {}
+    dataset = source.get("dataset") or dataset or "mushroom"
+    reader = source.get("reader", "readFile")
+    binary = source.get("binary", True)
+    previous = os.getcwd()
+    os.chdir(os.path.abspath(os.path.join(script_dir, "..", "data")))#the readers match the bare file name
+    try:
+        if reader == "readFileKNN":
+            return encodeFeatures(readFileKNN(_FILE_MAP[dataset]))[:, :-1].astype(float)
+        if reader == "readFileOneHot":
+            return readFileOneHot(_FILE_MAP[dataset], binary)[0].toarray()
+        if reader != "readFile":
+            raise ValueError(f"unknown reader {reader!r} in the model source")
+        return np.asarray(readFile(_FILE_MAP[dataset], binary)[0], dtype=float)
+    finally:
+        os.chdir(previous)
+
+
+def _percentiles(samples):
+    #p50 / p99 in milliseconds of a sequence of latencies in seconds
+    if not samples:
+        return None, None
+    p50, p99 = np.percentile(np.fromiter(samples, dtype=float), [50, 99]) * 1000
+    return round(float(p50), 3), round(float(p99), 3)
+
+
+class MicroBatcher:
+    '''
+    ===================================================================================
+    DESCRIPTION:
+    ===================================================================================
+    collect the rows of concurrent requests into micro-batches and score each batch with
+    one vectorized model.predict call. A batch is closed once it holds max_batch rows or
+    window_ms after its first request arrived, whichever comes first. Scoring runs in a
+    worker thread, one batch at a time, so the event loop keeps accepting (and batching)
+    requests meanwhile and the model is never used by two batches at once
+    ===================================================================================
+    PARAMETERS:
+    ===================================================================================
+    * model (LogisticRegression or kNN):
+    ----------------------------------------
+    fitted model, e.g. from Models.load_model
+    ----------------------------------------
+    * max_batch (int):
+    ----------------------------------------
+    most rows scored by one predict call (a single larger request is scored alone)
+    ----------------------------------------
+    * window_ms (float):
+    ----------------------------------------
+    longest a request waits for others to join its batch, the latency added at low load
+    ----------------------------------------
+    * history (int):
+    ----------------------------------------
+    latencies kept for the p50/p99 of stats
+    ===================================================================================
+    '''
+    def __init__(self, model, max_batch=256, window_ms=2.0, history=10000):
+        self.model = model
+        self.num_features = _num_features(model)
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.queue = None
+        self.task = None
+        self.latencies = deque(maxlen=history)#seconds from arrival to scored, last history requests
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.__run())
+        self.started = time.perf_counter()
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    async def predict(self, rows):
+        '''
+        ===================================================================================
+        DESCRIPTION:
+        ===================================================================================
+        queue rows (one request) for the next batch and wait for their predictions.
+        Raises ValueError for rows the model cannot score, before they join a batch
+        ===================================================================================
+        '''
+        arrived = time.perf_counter()
+        rows = np.asarray(rows, dtype=float)
+        if rows.ndim == 1:
+            rows = rows[None, :]
+        if rows.ndim != 2 or rows.shape[1] != self.num_features or len(rows) == 0:
+            raise ValueError(f"rows must be a non empty list of {self.num_features} feature lists, got shape {rows.shape}")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((rows, future, arrived))
+        return await future
+
+    async def __run(self):
+        '''
+        ===================================================================================
+        DESCRIPTION:
+        ===================================================================================
+        private batching loop started by start(): wait for a request, gather more until
+        the batch is full or its window closes, score, hand every request its slice
+        ===================================================================================
+        '''
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            count = len(batch[0][0])
+            deadline = loop.time() + self.window
+            while count < self.max_batch:
+                if self.queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self.queue.get_nowait()#already waiting, no timer needed
+                batch.append(item)
+                count += len(item[0])
+
+            data = batch[0][0] if len(batch) == 1 else np.vstack([rows for rows, _, _ in batch])
+            try:
+                predictions = await loop.run_in_executor(None, self.model.predict, data)
+            except Exception as error:
+                self.errors += len(batch)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            predictions = np.asarray(predictions).tolist()
+            finished = time.perf_counter()
+            self.batches += 1
+            self.rows += count
+            start = 0
+            for rows, future, arrived in batch:
+                self.requests += 1
+                self.latencies.append(finished - arrived)
+                if not future.done():#client gone
+                    future.set_result(predictions[start:start + len(rows)])
+                start += len(rows)
+
+    def stats(self):
+        #counters since start, latencies over the last history requests
+        elapsed = time.perf_counter() - self.started
+        p50, p99 = _percentiles(self.latencies)
+        return {
+            "requests": self.requests,
+            "rows": self.rows,
+            "batches": self.batches,
+            "errors": self.errors,
+            "mean_batch_rows": round(self.rows / self.batches, 2) if self.batches else 0,
+            "p50_ms": p50,
+            "p99_ms": p99,
+            "requests_per_s": round(self.requests / elapsed, 2),
+            "rows_per_s": round(self.rows / elapsed, 2),
+            "uptime_s": round(elapsed, 3),
+            "max_batch": self.max_batch,
+            "window_ms": self.window * 1000,
+        }
+
+
+async def _read_request(reader):
+    #one HTTP/1.1 request as (method, path, headers, body), None once the client closes
+    line = await reader.readline()
+    if not line:
+        return None
+    method, path, _ = line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > _MAX_BODY:
+        raise ValueError(f"request body of {length} bytes is over the {_MAX_BODY} byte limit")
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+
+def _write_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+
+
+def make_handler(batcher):
+    '''
+    ===================================================================================
+    DESCRIPTION:
+    ===================================================================================
+    connection handler for asyncio.start_server / start_unix_server. Keep-alive HTTP/1.1
+    with JSON bodies:
+        POST /predict  {"rows": [[feature, ...], ...]}  ->  {"predictions": [...]}
+        GET  /stats    counters and p50/p99 latency of the batcher
+        GET  /info     model type, feature count and how its training rows were read
+        GET  /health   {"status": "ok"}
+    ===================================================================================
+    '''
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except (ValueError, asyncio.IncompleteReadError) as error:
+                    _write_response(writer, 400, {"error": str(error)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if path == "/predict" and method == "POST":
+                    try:
+                        rows = json.loads(body)["rows"]
+                        status, payload = 200, {"predictions": await batcher.predict(rows)}
+                    except (ValueError, KeyError, TypeError) as error:
+                        status, payload = 400, {"error": str(error)}
+                    except Exception as error:
+                        status, payload = 500, {"error": str(error)}
+                elif path == "/stats" and method == "GET":
+                    status, payload = 200, batcher.stats()
+                elif path == "/info" and method == "GET":
+                    status, payload = 200, {"model": type(batcher.model).__name__, "num_features": batcher.num_features,
+                                            "source": getattr(batcher.model, "source", None)}
+                elif path == "/health" and method == "GET":
+                    status, payload = 200, {"status": "ok"}
+                elif path in ("/predict", "/stats", "/info", "/health"):
+                    status, payload = 405, {"error": f"{method} not allowed on {path}"}
+                else:
+                    status, payload = 404, {"error": f"no route {path}"}
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(model_path, host="127.0.0.1", port=8000, unix=None, max_batch=256, window_ms=2.0):
+    '''
+    ===================================================================================
+    DESCRIPTION:
+    ===================================================================================
+    load the model directory once (kNN.save or LogisticRegression.save) and serve it
+    over HTTP on host:port, or on the unix socket path unix, until cancelled
+    ===================================================================================
+    '''
+    model = load_model(model_path)
+    batcher = MicroBatcher(model, max_batch, window_ms)
+    await batcher.start()
+    if unix:
+        server = await asyncio.start_unix_server(make_handler(batcher), path=unix)
+        where = unix
+    else:
+        server = await asyncio.start_server(make_handler(batcher), host, port)
+        where = f"http://{host}:{port}"
+    print(f"Serving {type(model).__name__} from {model_path} on {where} "
+          f"(max_batch={max_batch}, window_ms={window_ms})", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+async def _open(host, port, unix):
+    if unix:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+
+async def _call(reader, writer, method, path, payload=None):
+    #one keep-alive request, returns (status, decoded JSON body)
+    body = b"" if payload is None else json.dumps(payload).encode()
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def _info(host, port, unix):
+    reader, writer = await _open(host, port, unix)
+    try:
+        return (await _call(reader, writer, "GET", "/info"))[1]
+    finally:
+        writer.close()
+
+
+async def load_test(rows, host="127.0.0.1", port=8000, unix=None, concurrency=32, requests=2000, rows_per_request=1):
+    '''
+    ===================================================================================
+    DESCRIPTION:
+    ===================================================================================
+    local load generator: concurrency clients, each on its own keep-alive connection,
+    send requests POST /predict between them (rows_per_request rows cycled from rows)
+    as fast as answers come back
+    ===================================================================================
+    RETURNS:
+    ===================================================================================
+    * report (dict):
+    ----------------------------------------
+    client side requests/s, rows/s, p50/p99 latency and error count, plus the server's
+    /stats after the run
+    ===================================================================================
+    '''
+    rows = np.asarray(rows, dtype=float).tolist()
+    latencies = []
+    errors = 0
+    sent = 0
+
+    async def client():
+        nonlocal errors, sent
+        reader, writer = await _open(host, port, unix)
+        try:
+            while sent < requests:
+                start = (sent * rows_per_request) % len(rows)
+                sent += 1
+                payload = {"rows": [rows[(start + i) % len(rows)] for i in range(rows_per_request)]}
+                began = time.perf_counter()
+                status, _ = await _call(reader, writer, "POST", "/predict", payload)
+                latencies.append(time.perf_counter() - began)
+                errors += status != 200
+        finally:
+            writer.close()
+
+    began = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - began
+    reader, writer = await _open(host, port, unix)
+    _, server_stats = await _call(reader, writer, "GET", "/stats")
+    writer.close()
+    p50, p99 = _percentiles(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 2),
+        "rows_per_s": round(len(latencies) * rows_per_request / elapsed, 2),
+        "p50_ms": p50,
+        "p99_ms": p99,
+        "server": server_stats,
+    }
+
+
+def main() -> None:
+    """
+    Serve a saved LogisticRegression / kNN, or benchmark a running server.
+
+    Examples
+    --------
+    python Models.py --model logistic --dataset mushroom --save mushroom_lr
+    python Server.py serve --model_path mushroom_lr --port 8000 --window_ms 2
+    python Server.py bench --port 8000 --concurrency 64 --requests 5000
+    """
+    import argparse
+
+    p = argparse.ArgumentParser(description="Micro-batching scoring server for saved models")
+    commands = p.add_subparsers(dest="command", required=True)
+    for name in ("serve", "bench"):
+        command = commands.add_parser(name)
+        command.add_argument("--host", default="127.0.0.1")
+        command.add_argument("--port", type=int, default=8000)
+        command.add_argument("--unix", default=None)          # unix socket path instead of host/port
+    serve_args = commands.choices["serve"]
+    serve_args.add_argument("--model_path", required=True)  # directory written by save
+    serve_args.add_argument("--max_batch", type=int, default=256)
+    serve_args.add_argument("--window_ms", type=float, default=2.0)
+    bench_args = commands.choices["bench"]
+    bench_args.add_argument("--dataset", choices=sorted(_FILE_MAP), default=None)  # only for models saved without a source
+    bench_args.add_argument("--concurrency", type=int, default=32)
+    bench_args.add_argument("--requests", type=int, default=2000)
+    bench_args.add_argument("--rows", type=int, default=1)  # rows per request
+    args = p.parse_args()
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.model_path, args.host, args.port, args.unix, args.max_batch, args.window_ms))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    info = asyncio.run(_info(args.host, args.port, args.unix))#rows are read the way the served model was trained
+    rows = bench_rows(info["source"], args.dataset)
+    if rows.shape[1] != info["num_features"]:
+        p.error(f"{args.dataset or info['source']} rows have {rows.shape[1]} features, the served {info['model']} expects {info['num_features']}")
+    report = asyncio.run(load_test(rows, args.host, args.port, args.unix, args.concurrency, args.requests, args.rows))
+    print(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()